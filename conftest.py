@@ -0,0 +1,12 @@
+import pytest
+
+from core.testing import isolated_cache
+
+
+@pytest.fixture(autouse=True, scope='session')
+def test_cache():
+    '''
+    Тесты не должны чистить общий с воркерами кеш
+    '''
+    with isolated_cache():
+        yield
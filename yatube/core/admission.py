@@ -0,0 +1,185 @@
+import hashlib
+import re
+import threading
+import time
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import render
+
+PAGE_KEY_TEMPLATE = 'admission.page.v2.%s'
+# Заголовки, которые у копии страницы свои или которые
+# нельзя раздавать всем подряд
+SKIP_HEADERS = {'set-cookie', 'age', 'content-length'}
+
+NORMAL = 0
+# Анонимам отдаём сохранённые страницы
+DEGRADED = 1
+# Вдобавок отказываем низкоприоритетным запросам
+SHEDDING = 2
+
+
+def option(name):
+    defaults = {
+        'ADMISSION_SOFT_LIMIT': 8,
+        'ADMISSION_HARD_LIMIT': 16,
+        'ADMISSION_SOFT_QUEUE_WAIT': 0.5,
+        'ADMISSION_HARD_QUEUE_WAIT': 2,
+        'ADMISSION_QUEUE_HEADER': 'HTTP_X_REQUEST_START',
+        'ADMISSION_LOW_PRIORITY_PATHS': (),
+        'ADMISSION_MAX_PAGE': 10,
+        'ADMISSION_RETRY_AFTER': 10,
+        'ADMISSION_PAGE_REFRESH': 30,
+        'ADMISSION_PAGE_TTL': 60 * 60,
+    }
+    return getattr(settings, name, defaults[name])
+
+
+def parse_request_start(value):
+    '''
+    Время постановки запроса в очередь прокси: 't=1600000000.123'
+    в секундах (nginx), миллисекундах или микросекундах
+    '''
+    try:
+        started = float(value.replace('t=', '', 1))
+    except ValueError:
+        return None
+
+    if started > 1e14:
+        return started / 1e6
+    if started > 1e11:
+        return started / 1e3
+    return started
+
+
+def queue_wait(request, now):
+    value = request.META.get(option('ADMISSION_QUEUE_HEADER'))
+    started = parse_request_start(value) if value else None
+    return max(now - started, 0) if started else 0
+
+
+def is_anonymous(request):
+    # Сессии ещё нет, но у вошедшего пользователя всегда есть её кука
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def is_low_priority(request):
+    '''
+    Запросы, которыми жертвуем первыми: глубокие страницы
+    паджинатора и пути из ADMISSION_LOW_PRIORITY_PATHS
+    '''
+    page = request.GET.get('page', '')
+    if page.isdigit() and int(page) > option('ADMISSION_MAX_PAGE'):
+        return True
+
+    return any(re.search(pattern, request.path)
+               for pattern in option('ADMISSION_LOW_PRIORITY_PATHS'))
+
+
+def page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_KEY_TEMPLATE % path
+
+
+def service_unavailable(request):
+    retry_after = option('ADMISSION_RETRY_AFTER')
+    response = render(request,
+                      'core/503.html',
+                      {'retry_after': retry_after},
+                      status=HTTPStatus.SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class AdmissionControlMiddleware:
+    '''
+    Сброс нагрузки, когда запросы начинают копиться
+
+    Нагрузка - число запросов, одновременно обрабатываемых процессом,
+    и время ожидания в очереди прокси из заголовка X-Request-Start.
+    Выше мягкого порога анонимам отдаются сохранённые копии страниц
+    (пусть и устаревшие), выше жёсткого - низкоприоритетные запросы
+    получают 503 с Retry-After
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        # Когда процесс последний раз сохранял копию страницы
+        self.stored = {}
+
+    def get_level(self, request, now):
+        wait = queue_wait(request, now)
+        if (self.in_flight > option('ADMISSION_HARD_LIMIT')
+                or wait > option('ADMISSION_HARD_QUEUE_WAIT')):
+            return SHEDDING
+        if (self.in_flight > option('ADMISSION_SOFT_LIMIT')
+                or wait > option('ADMISSION_SOFT_QUEUE_WAIT')):
+            return DEGRADED
+        return NORMAL
+
+    def __call__(self, request):
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return self.handle(request)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def handle(self, request):
+        now = time.time()
+        level = self.get_level(request, now)
+        cacheable = request.method in ('GET', 'HEAD') and is_anonymous(request)
+
+        if level >= DEGRADED and cacheable:
+            response = self.stored_response(request, now)
+            if response is not None:
+                return response
+
+        if level == SHEDDING and is_low_priority(request):
+            return service_unavailable(request)
+
+        response = self.get_response(request)
+
+        if level == NORMAL and cacheable:
+            self.store(request, response, now)
+        return response
+
+    def stored_response(self, request, now):
+        page = cache.get(page_key(request))
+        if page is None:
+            return None
+
+        content, headers, stored_at = page
+        response = HttpResponse(content)
+        # Копия отдаётся в обход внутренних middleware, поэтому их
+        # заголовки (X-Frame-Options и прочие) берутся из оригинала
+        for header, value in headers:
+            response[header] = value
+        response['Age'] = str(int(now - stored_at))
+        return response
+
+    def store(self, request, response, now):
+        '''
+        Копия анонимной страницы на случай перегрузки, не чаще
+        раза в ADMISSION_PAGE_REFRESH секунд на адрес
+        '''
+        if (response.status_code != HTTPStatus.OK or response.streaming
+                or response.cookies
+                or 'no-store' in response.get('Cache-Control', '')):
+            return
+
+        key = page_key(request)
+        if now - self.stored.get(key, 0) < option('ADMISSION_PAGE_REFRESH'):
+            return
+
+        if len(self.stored) > 10000:
+            self.stored.clear()
+        self.stored[key] = now
+        headers = [(header, value) for header, value in response.items()
+                   if header.lower() not in SKIP_HEADERS]
+        cache.set(key, (response.content, headers, now),
+                  option('ADMISSION_PAGE_TTL'))
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model, user_logged_out
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .middleware import invalidate_user
+
+        User = get_user_model()
+        post_save.connect(invalidate_user, sender=User,
+                          dispatch_uid='user_cache_post_save')
+        post_delete.connect(invalidate_user, sender=User,
+                            dispatch_uid='user_cache_post_delete')
+        user_logged_out.connect(invalidate_user,
+                                dispatch_uid='user_cache_logged_out')
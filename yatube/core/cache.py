@@ -0,0 +1,246 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class SharedFileCache(BaseCache):
+    '''
+    Кеш, общий для всех воркеров на одном хосте
+
+    Данные лежат в одном файле SQLite, который каждый процесс
+    отображает в память (mmap), так что внешний сервис не нужен.
+    Поддерживаются вытеснение по LRU, ограничение по количеству
+    записей (MAX_ENTRIES) и по суммарному размеру (MAX_SIZE, байт),
+    а также атомарные incr/decr.
+
+    Файл лучше держать в /dev/shm - тогда это фактически shared memory
+    '''
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    # Время последнего обращения обновляем не чаще раза в секунду,
+    # иначе каждое чтение превращается в запись
+    touch_resolution = 1
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+
+        self._path = os.path.abspath(location)
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._mmap_size = int(options.get('MMAP_SIZE', self._max_size * 2))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+
+    @property
+    def _connection(self):
+        # Соединение своё у каждого потока и у каждого процесса:
+        # после fork() унаследованным соединением пользоваться нельзя
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._connect()
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+
+        return connection
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        connection = sqlite3.connect(self._path,
+                                     timeout=self._busy_timeout,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute(f'PRAGMA mmap_size = {self._mmap_size}')
+        connection.execute('PRAGMA synchronous = OFF')
+
+        with self._schema_lock:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                ' key TEXT PRIMARY KEY,'
+                ' value BLOB NOT NULL,'
+                ' expires REAL,'
+                ' accessed REAL NOT NULL,'
+                ' size INTEGER NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed'
+                               ' ON cache (accessed)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_expires'
+                               ' ON cache (expires)')
+
+        return connection
+
+    def _transaction(self):
+        '''
+        BEGIN IMMEDIATE сразу берёт блокировку на запись,
+        поэтому чтение и запись внутри транзакции атомарны
+        для всех процессов
+        '''
+        return _Transaction(self._connection)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        blob = self._dumps(value)
+        now = time.time()
+
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM cache WHERE key = ? AND expires < ?',
+                           (key, now))
+            cursor.execute('INSERT OR IGNORE INTO cache'
+                           ' (key, value, expires, accessed, size)'
+                           ' VALUES (?, ?, ?, ?, ?)',
+                           (key, blob, self.get_backend_timeout(timeout),
+                            now, len(blob)))
+            added = cursor.rowcount == 1
+            if added:
+                self._cull(cursor, now)
+
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+
+        row = self._connection.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,)
+        ).fetchone()
+
+        if row is None:
+            return default
+
+        value, expires, accessed = row
+        if expires is not None and expires < now:
+            return default
+
+        if now - accessed > self.touch_resolution:
+            self._connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        blob = self._dumps(value)
+        now = time.time()
+
+        with self._transaction() as cursor:
+            cursor.execute('INSERT OR REPLACE INTO cache'
+                           ' (key, value, expires, accessed, size)'
+                           ' VALUES (?, ?, ?, ?, ?)',
+                           (key, blob, self.get_backend_timeout(timeout),
+                            now, len(blob)))
+            self._cull(cursor, now)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+
+        with self._transaction() as cursor:
+            cursor.execute('UPDATE cache SET expires = ?, accessed = ?'
+                           ' WHERE key = ?'
+                           ' AND (expires IS NULL OR expires >= ?)',
+                           (self.get_backend_timeout(timeout), now, key, now))
+            return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+
+        row = self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires >= ?)',
+            (key, time.time())
+        ).fetchone()
+
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+
+        with self._transaction() as cursor:
+            row = cursor.execute(
+                'SELECT value FROM cache WHERE key = ?'
+                ' AND (expires IS NULL OR expires >= ?)',
+                (key, now)
+            ).fetchone()
+
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+
+            new_value = pickle.loads(row[0]) + delta
+            blob = self._dumps(new_value)
+            cursor.execute('UPDATE cache SET value = ?, size = ?, accessed = ?'
+                           ' WHERE key = ?',
+                           (blob, len(blob), now, key))
+
+        return new_value
+
+    def clear(self):
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM cache')
+
+    def _cull(self, cursor, now):
+        '''
+        Сначала выкидываем протухшие записи, затем - давно
+        не использованные, пока не уложимся в MAX_ENTRIES и MAX_SIZE
+        '''
+        count, size = cursor.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache'
+        ).fetchone()
+
+        if count <= self._max_entries and size <= self._max_size:
+            return
+
+        cursor.execute('DELETE FROM cache WHERE expires < ?', (now,))
+        count, size = cursor.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache'
+        ).fetchone()
+
+        # Как и в стандартных бекендах - освобождаем сразу 1/CULL_FREQUENCY
+        # записей, чтобы не вытеснять по одной на каждый set()
+        batch = max(count // max(self._cull_frequency, 1), 1)
+        while count > self._max_entries or size > self._max_size:
+            cursor.execute('DELETE FROM cache WHERE key IN ('
+                           ' SELECT key FROM cache'
+                           ' ORDER BY accessed LIMIT ?)', (batch,))
+            count, size = cursor.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache'
+            ).fetchone()
+            if count == 0:
+                break
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection.cursor()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.execute('COMMIT')
+        else:
+            self.connection.execute('ROLLBACK')
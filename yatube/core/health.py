@@ -0,0 +1,122 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+
+from .models import Task
+
+executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='health')
+memo_lock = threading.Lock()
+memo = {'result': None, 'expires': 0}
+
+
+def option(name):
+    defaults = {
+        'HEALTH_PROBE_TIMEOUT': 2,
+        'HEALTH_CACHE_SECONDS': 2,
+        'HEALTH_MAX_TASK_LAG': 300,
+    }
+    return getattr(settings, name, defaults[name])
+
+
+def probe_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def probe_cache():
+    token = uuid.uuid4().hex
+    cache.set('health.probe', token, 10)
+    if cache.get('health.probe') != token:
+        raise RuntimeError('Кеш не вернул записанное значение')
+
+
+def probe_media():
+    name = default_storage.save(f'health/{uuid.uuid4().hex}.txt',
+                                ContentFile(b'ok'))
+    default_storage.delete(name)
+
+
+def probe_tasks():
+    '''
+    Очередь фоновых задач: сколько готовых к выполнению задач ждут
+    воркера и как давно ждёт самая старая из них
+    '''
+    now = timezone.now()
+    ready = Task.objects.filter(status=Task.QUEUED, run_after__lte=now)
+    oldest = ready.order_by('run_after').values_list('run_after',
+                                                     flat=True).first()
+    lag = (now - oldest).total_seconds() if oldest else 0
+
+    if lag > option('HEALTH_MAX_TASK_LAG'):
+        raise RuntimeError(f'Задачи ждут воркера {lag:.0f} с')
+    return {'backlog': ready.count(), 'lag': round(lag, 1)}
+
+
+PROBES = {
+    'database': probe_database,
+    'cache': probe_cache,
+    'media': probe_media,
+    'tasks': probe_tasks,
+}
+
+
+def run_probe(probe):
+    started = time.monotonic()
+    try:
+        result = {'status': 'ok', **(probe() or {})}
+    except Exception as error:
+        result = {'status': 'fail', 'error': str(error)}
+    finally:
+        # В потоке пула своё соединение с базой
+        connection.close()
+
+    result['latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+
+def run_probes(probes=None, timeout=None):
+    '''
+    Параллельный запуск проверок, каждой отводится не больше
+    timeout секунд. Зависшая проверка считается проваленной
+    '''
+    probes = PROBES if probes is None else probes
+    timeout = option('HEALTH_PROBE_TIMEOUT') if timeout is None else timeout
+
+    futures = {name: executor.submit(run_probe, probe)
+               for name, probe in probes.items()}
+    wait(futures.values(), timeout=timeout)
+
+    checks = {}
+    for name, future in futures.items():
+        if future.done():
+            checks[name] = future.result()
+        else:
+            checks[name] = {'status': 'fail',
+                            'error': 'Таймаут',
+                            'latency_ms': timeout * 1000}
+
+    healthy = all(check['status'] == 'ok' for check in checks.values())
+    return {'status': 'ok' if healthy else 'fail', 'checks': checks}
+
+
+def get_readiness():
+    '''
+    Результат проверок, запомненный в процессе на HEALTH_CACHE_SECONDS:
+    сколько бы раз оркестратор ни спрашивал, база получит
+    не больше одного запроса за этот интервал
+    '''
+    with memo_lock:
+        now = time.monotonic()
+        if memo['result'] is None or now >= memo['expires']:
+            memo['result'] = run_probes()
+            memo['expires'] = now + option('HEALTH_CACHE_SECONDS')
+        return memo['result']
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''
+    Кеш в памяти процесса на maxsize записей с вытеснением давно
+    не использованных и временем жизни ttl секунд
+
+    Отсутствие (None от загрузчика) тоже кешируется, но на
+    negative_ttl секунд: несуществующие адреса не ходят в базу,
+    а новые объекты появляются быстро
+    '''
+    def __init__(self, maxsize=1024, ttl=60, negative_ttl=10):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Загрузка вне блокировки: медленный запрос к базе
+        # не должен останавливать остальные потоки
+        value = loader()
+        ttl = self.ttl if value is not None else self.negative_ttl
+
+        with self.lock:
+            self.entries[key] = (value, now + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return value
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        '''
+        Удаление записей, значение которых подходит под predicate:
+        например, объекта, сменившего ключ (переименованного)
+        '''
+        with self.lock:
+            stale = [key for key, (value, _) in self.entries.items()
+                     if value is not None and predicate(value)]
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = 'Выполнение фоновых задач из очереди core.tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'TASKS_WORKERS', 4),
+                            help='Размер пула')
+        parser.add_argument('--pool', choices=('thread', 'process'),
+                            default='thread',
+                            help='Пул потоков или процессов')
+        parser.add_argument('--poll-interval', type=float, default=1,
+                            help='Как часто проверять очередь, секунд')
+        parser.add_argument('--visibility-timeout', type=int, default=None,
+                            help='Через сколько секунд задачу упавшего '
+                                 'воркера заберёт другой')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и выйти')
+
+    def handle(self, *args, **options):
+        worker = Worker(workers=options['workers'],
+                        pool=options['pool'],
+                        poll_interval=options['poll_interval'],
+                        visibility_timeout=options['visibility_timeout'])
+        worker.run(once=options['once'])
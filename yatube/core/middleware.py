@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+USER_KEY_TEMPLATE = 'auth.user.%s'
+
+
+def user_cache_key(user_id):
+    return USER_KEY_TEMPLATE % user_id
+
+
+def invalidate_user(sender, instance=None, user=None, **kwargs):
+    '''
+    Обработчик сигналов post_save/post_delete модели пользователя
+    и user_logged_out: выкидывает пользователя из кеша
+    '''
+    user = instance or user
+    if user is not None and user.pk is not None:
+        cache.delete(user_cache_key(user.pk))
+
+
+def get_cached_user(request):
+    '''
+    Аналог django.contrib.auth.get_user, который берет пользователя
+    из кеша по id из сессии, а в базу идёт только при промахе
+    '''
+    try:
+        user_id = request.session[auth.SESSION_KEY]
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            cache.set(key, user,
+                      getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60))
+        return user
+
+    # Проверка сессии как в auth.get_user: после смены пароля
+    # хеш в сессии перестаёт совпадать
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(
+            session_hash, user.get_session_auth_hash())):
+        request.session.flush()
+        return AnonymousUser()
+
+    return user
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = get_cached_user(request)
+    return request._cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    '''
+    Замена AuthenticationMiddleware, которая не ходит в auth_user
+    на каждый запрос. Запись в кеше сбрасывается при любом
+    сохранении пользователя (в том числе смене пароля) и при выходе
+    '''
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
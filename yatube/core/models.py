@@ -0,0 +1,55 @@
+from django.db import models
+
+
+class Task(models.Model):
+    '''
+    Фоновая задача в очереди core.tasks
+
+    Задачу выполняет воркер (manage.py run_worker), захватывая её
+    до locked_until. Если воркер умер и не отчитался, по истечении
+    locked_until задачу заберёт другой воркер
+    '''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Функция', max_length=200)
+    arguments = models.TextField('Аргументы (JSON)', default='{}')
+    priority = models.IntegerField('Приоритет', default=0)
+    status = models.CharField('Статус', max_length=10,
+                              choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Максимум попыток', default=3)
+    run_after = models.DateTimeField('Не раньше чем')
+    locked_until = models.DateTimeField('Захвачена до', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+
+    class Meta:
+        ordering = ['-priority', 'pk']
+        indexes = [models.Index(fields=['status', 'run_after'],
+                                name='task_status_run_after')]
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
+
+
+class StoredFile(models.Model):
+    '''
+    Файл в core.storage.ContentAddressedStorage и количество
+    загрузок, которые на него ссылаются
+    '''
+    name = models.CharField('Имя', max_length=255, unique=True)
+    references = models.PositiveIntegerField('Ссылок', default=1)
+    created = models.DateTimeField('Создан', auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
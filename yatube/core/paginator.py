@@ -0,0 +1,112 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+COUNT_KEY_TEMPLATE = 'paginator.count.%s.%s'
+GENERATION_KEY_TEMPLATE = 'paginator.generation.%s'
+
+
+def generation_key(model):
+    return GENERATION_KEY_TEMPLATE % model._meta.label_lower
+
+
+def bump_generation(sender, **kwargs):
+    '''
+    Любое изменение модели делает устаревшими все
+    закешированные COUNT(*) по ней
+    '''
+    try:
+        cache.incr(generation_key(sender))
+    except ValueError:
+        # Ключа нет - значит и закешированных счетчиков по модели нет
+        pass
+
+
+def cached_count(queryset, depends_on=()):
+    '''
+    COUNT(*) queryset через кеш: ключ - сигнатура запроса (SQL +
+    параметры) и поколения его модели и моделей из depends_on
+    '''
+    min_count = getattr(settings, 'PAGINATOR_CACHE_MIN_COUNT', 1000)
+    timeout = getattr(settings, 'PAGINATOR_CACHE_TIMEOUT', 300)
+    models = {queryset.model, *depends_on}
+
+    keys = sorted(generation_key(model) for model in models)
+    # Чтение на каждый запрос, запись - только для нового ключа
+    stored = cache.get_many(keys)
+    for key in keys:
+        if key not in stored:
+            cache.add(key, 0, None)
+            stored[key] = cache.get(key, 0)
+    generations = [f'{key}={stored[key]}' for key in keys]
+
+    sql, params = queryset.query.sql_with_params()
+    signature = hashlib.md5(
+        f'{sql}|{params}|{";".join(generations)}'.encode()
+    ).hexdigest()
+    count_key = COUNT_KEY_TEMPLATE % (queryset.model._meta.label_lower,
+                                      signature)
+
+    count = cache.get(count_key)
+    if count is None:
+        count = queryset.count()
+        if count >= min_count:
+            cache.set(count_key, count, timeout)
+
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    '''
+    Паджинатор, который не пересчитывает COUNT(*) на каждый запрос
+
+    Количество объектов кешируется по сигнатуре запроса (SQL + параметры)
+    и поколению моделей из depends_on, которое сдвигается при каждом
+    сохранении или удалении их объектов. Для этого приложение, которое
+    считает объекты модели, подключает к её сигналам bump_generation
+    (см. PostsConfig). Маленькие выборки не кешируются: их COUNT(*)
+    дешевле, чем поход в кеш и риск устаревания
+    '''
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, *args, depends_on=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.depends_on = depends_on or ()
+
+    @cached_property
+    def count(self):
+        # Не QuerySet (например, posts.archive.ArchiveChain) сам
+        # решает, как считать: Paginator вызовет его count()
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        return cached_count(self.object_list, self.depends_on)
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        '''
+        Номера страниц вокруг текущей и по краям, с многоточиями
+        между ними, чтобы не выводить ссылку на каждую страницу
+        '''
+        number = self.validate_number(number)
+
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+
+        if number > (1 + on_each_side + on_ends) + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+
+        if number < (self.num_pages - on_each_side - on_ends) - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1,
+                             self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
@@ -0,0 +1,141 @@
+import math
+import time
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+KEY_TEMPLATE = 'ratelimit.%s.%s'
+LOCK_KEY_TEMPLATE = '%s.lock'
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+DEFAULT_METHODS = ('POST',)
+# Сколько раз и с какой паузой ждать блокировку корзины
+LOCK_ATTEMPTS = 20
+LOCK_DELAY = 0.005
+
+
+def parse_rate(rate):
+    '''
+    '20/h' -> (20, 3600), '5/10m' -> (5, 600)
+    '''
+    limit, period = rate.split('/')
+    multiplier = period[:-1] or 1
+    return int(limit), int(multiplier) * PERIODS[period[-1]]
+
+
+def get_limit(view_name):
+    '''
+    Ограничение для представления из settings.RATE_LIMITS:
+    строка с частотой или пара (частота, методы).
+    По умолчанию считаются только POST запросы
+    '''
+    rule = getattr(settings, 'RATE_LIMITS', {}).get(view_name)
+    if rule is None:
+        return None
+
+    rate, methods = (rule, DEFAULT_METHODS) if isinstance(rule, str) else rule
+    return parse_rate(rate) + (methods,)
+
+
+def get_ident(request):
+    '''
+    Кого ограничиваем: пользователя, а анонима - по IP.
+    За прокси адрес клиента берётся из RATE_LIMIT_IP_HEADER
+    '''
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', 'REMOTE_ADDR')
+    address = request.META.get(header, '').split(',')[0].strip()
+    return f'ip:{address}'
+
+
+def lock_bucket(lock_key):
+    '''
+    Блокировка корзины в кеше: add атомарен, а через секунду
+    блокировка протухнет сама, даже если процесс умер
+    '''
+    for _ in range(LOCK_ATTEMPTS):
+        if cache.add(lock_key, 1, 1):
+            return True
+        time.sleep(LOCK_DELAY)
+    return False
+
+
+def take_token(view_name, ident, limit, period, now=None):
+    '''
+    Забрать токен из корзины на limit токенов, которая наполняется
+    равномерно, по limit / period токенов в секунду
+
+    В кеше лежит пара (сколько токенов, когда посчитано). Пара
+    читается и записывается под блокировкой, поэтому одновременные
+    запросы одного клиента не потратят один токен дважды.
+
+    Возвращает 0, если токен есть, иначе сколько секунд ждать
+    '''
+    key = KEY_TEMPLATE % (view_name, ident)
+    lock_key = LOCK_KEY_TEMPLATE % key
+    if not lock_bucket(lock_key):
+        # Корзину держат параллельные запросы того же клиента
+        return 1
+
+    try:
+        if now is None:
+            now = time.time()
+
+        tokens, updated = cache.get(key, (limit, now))
+        tokens = min(limit, tokens + (now - updated) * limit / period)
+        if tokens < 1:
+            return math.ceil((1 - tokens) * period / limit)
+
+        # За period секунд корзина наполняется целиком, дальше
+        # хранить её незачем
+        cache.set(key, (tokens - 1, now), period)
+        return 0
+    finally:
+        cache.delete(lock_key)
+
+
+def too_many_requests(request, retry_after):
+    response = render(request,
+                      'core/429.html',
+                      {'retry_after': retry_after},
+                      status=HTTPStatus.TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class RateLimitMiddleware:
+    '''
+    Ограничение частоты запросов к представлениям по их имени
+    из settings.RATE_LIMITS:
+
+        RATE_LIMITS = {
+            'posts:post_create': '20/h',
+            'posts:profile_follow': ('60/h', ('GET',)),
+        }
+
+    Сверх лимита отвечает 429 с заголовком Retry-After
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        rule = get_limit(view_name)
+        if rule is None:
+            return None
+
+        limit, period, methods = rule
+        if request.method not in methods:
+            return None
+
+        retry_after = take_token(view_name, get_ident(request),
+                                 limit, period)
+        if retry_after:
+            return too_many_requests(request, retry_after)
+        return None
@@ -0,0 +1,102 @@
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from http import HTTPStatus
+
+from django.conf import settings
+
+# Имена вида style.3f2a9c1b7e4d.css, которые пишет ManifestStaticFilesStorage
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+
+def status_line(status):
+    return f'{status.value} {status.phrase}'
+
+
+def read_chunks(file, chunk_size=64 * 1024):
+    with file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class StaticFilesMiddleware:
+    '''
+    WSGI-обёртка, которая отдаёт собранную collectstatic статику
+    без внешнего веб-сервера
+
+    Файлы с хешем в имени отдаются с вечным Cache-Control,
+    для всех файлов выставляется ETag и поддерживается If-None-Match,
+    при Accept-Encoding: gzip отдаётся заранее сжатый вариант .gz.
+    Всё, что не нашлось в STATIC_ROOT, уходит дальше в Django
+    '''
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = os.path.abspath(root or settings.STATIC_ROOT)
+        self.prefix = prefix or settings.STATIC_URL
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        method = environ.get('REQUEST_METHOD', 'GET')
+
+        if method not in ('GET', 'HEAD') or not path.startswith(self.prefix):
+            return self.application(environ, start_response)
+
+        full_path = self.find(path[len(self.prefix):])
+        if full_path is None:
+            return self.application(environ, start_response)
+
+        return self.serve(full_path, environ, start_response)
+
+    def find(self, name):
+        full_path = os.path.normpath(os.path.join(self.root, name))
+        # Не выпускаем запрос за пределы STATIC_ROOT через ../
+        if not full_path.startswith(self.root + os.sep):
+            return None
+        if not os.path.isfile(full_path):
+            return None
+        return full_path
+
+    def serve(self, full_path, environ, start_response):
+        content_type, _ = mimetypes.guess_type(full_path)
+        headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL
+             if HASHED_NAME.search(full_path) else DEFAULT_CACHE_CONTROL),
+        ]
+
+        compressed_path = full_path + '.gz'
+        if os.path.isfile(compressed_path):
+            headers.append(('Vary', 'Accept-Encoding'))
+            if 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', ''):
+                full_path = compressed_path
+                headers.append(('Content-Encoding', 'gzip'))
+
+        stat = os.stat(full_path)
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        headers.append(('ETag', etag))
+        headers.append(('Last-Modified',
+                        formatdate(stat.st_mtime, usegmt=True)))
+
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH', '')
+        if etag in (tag.strip() for tag in if_none_match.split(',')):
+            start_response(status_line(HTTPStatus.NOT_MODIFIED), headers)
+            return []
+
+        headers.append(('Content-Length', str(stat.st_size)))
+        start_response(status_line(HTTPStatus.OK), headers)
+
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return []
+
+        file = open(full_path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(file)
+        return read_chunks(file)
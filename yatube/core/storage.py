@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json',
+                           '.xml', '.map', '.ico')
+# Файлы меньше этого размера не сжимаем - выигрыш меньше накладных расходов
+MIN_COMPRESS_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    '''
+    Хранилище статики для collectstatic: кроме файлов с хешем
+    содержимого в имени (style.3f2a9c1b7e4d.css) рядом пишет
+    заранее сжатые варианты (style.3f2a9c1b7e4d.css.gz),
+    которые отдаёт core.static.StaticFilesMiddleware
+    '''
+    def post_process(self, *args, **kwargs):
+        compressed = set()
+
+        for name, hashed_name, processed in super().post_process(*args,
+                                                                 **kwargs):
+            if not isinstance(processed, Exception):
+                for path in (name, hashed_name):
+                    if path and path not in compressed:
+                        self.compress(path)
+                        compressed.add(path)
+
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+
+        path = self.path(name)
+        if not os.path.exists(path) or (os.path.getsize(path)
+                                        < MIN_COMPRESS_SIZE):
+            return
+
+        with open(path, 'rb') as source:
+            content = source.read()
+
+        # mtime=0, чтобы сжатый файл не менялся от сборки к сборке
+        with open(path + '.gz', 'wb') as target:
+            target.write(gzip.compress(content, compresslevel=9, mtime=0))
+
+    def stored_name(self, name):
+        # Пока collectstatic не запускался (разработка, тесты),
+        # манифеста нет - отдаём имя без хеша вместо ошибки
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+def content_address(name, content):
+    '''
+    posts/photo.JPG -> posts/3f/2a/3f2a9c...e4d.jpg: sha256 содержимого,
+    первые два уровня каталогов - начало хеша
+    '''
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+
+    hexdigest = digest.hexdigest()
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, hexdigest[:2], hexdigest[2:4],
+                        hexdigest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    Файлы с именем по хешу содержимого в каталогах-шардах: ни один
+    каталог не разрастается до миллионов файлов, а одинаковые
+    загрузки хранятся один раз
+
+    Сколько постов ссылается на файл, считает StoredFile: save()
+    добавляет ссылку, delete() снимает её и удаляет файл вместе
+    с последней. Старые имена (posts/photo.jpg) читаются и удаляются
+    как обычно
+    '''
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = content_address(name, content)
+        try:
+            # Такой файл уже есть - только обновляем время изменения,
+            # чтобы gc_media (--min-age) не удалил его, пока пост
+            # с новой ссылкой ещё не сохранён
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            # При одновременной загрузке того же файла Django допишет
+            # к имени суффикс - содержимое от этого не пострадает
+            name = super().save(name, content, max_length)
+
+        self.add_reference(name)
+        return name
+
+    def add_reference(self, name):
+        references = StoredFile.objects.filter(name=name)
+        if references.update(references=F('references') + 1):
+            return
+
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name)
+        except IntegrityError:
+            references.update(references=F('references') + 1)
+
+    def delete(self, name):
+        if StoredFile.objects.filter(name=name, references__gt=1).update(
+                references=F('references') - 1):
+            return
+
+        StoredFile.objects.filter(name=name).delete()
+        super().delete(name)
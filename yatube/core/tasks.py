@@ -0,0 +1,172 @@
+import json
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+
+def enqueue(func, *args, priority=0, delay=0, max_attempts=None, **kwargs):
+    '''
+    Поставить вызов функции в очередь
+
+    func - сама функция уровня модуля или путь к ней строкой,
+    аргументы должны сериализоваться в JSON:
+
+        enqueue(send_digests, batch_size=50, priority=10)
+    '''
+    if isinstance(func, str):
+        name = func
+    else:
+        name = f'{func.__module__}.{func.__qualname__}'
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'TASKS_MAX_ATTEMPTS', 3)
+
+    return Task.objects.create(
+        name=name,
+        arguments=json.dumps({'args': args, 'kwargs': kwargs}),
+        priority=priority,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def claim_tasks(limit, visibility_timeout=None):
+    '''
+    Захват до limit задач, готовых к выполнению: сначала с большим
+    приоритетом, затем более старые
+
+    Захват - условный UPDATE по статусу и locked_until, прочитанным
+    вместе с задачей, поэтому два воркера одну задачу не получат
+    даже без SELECT ... FOR UPDATE SKIP LOCKED
+    '''
+    if visibility_timeout is None:
+        visibility_timeout = getattr(settings, 'TASKS_VISIBILITY_TIMEOUT',
+                                     300)
+    now = timezone.now()
+    expired = Q(status=Task.RUNNING, locked_until__lt=now)
+
+    # Воркер умирал на задаче столько раз, сколько у неё было попыток
+    Task.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED,
+        locked_until=None,
+        finished=now,
+        last_error='Истёк таймаут выполнения',
+    )
+
+    candidates = (Task.objects
+                  .filter(Q(status=Task.QUEUED) | expired,
+                          run_after__lte=now)
+                  .order_by('-priority', 'pk')
+                  .values_list('pk', 'status', 'locked_until')[:limit * 2])
+
+    claimed = []
+    for pk, status, locked_until in candidates:
+        if len(claimed) >= limit:
+            break
+
+        updated = Task.objects.filter(
+            pk=pk, status=status, locked_until=locked_until
+        ).update(
+            status=Task.RUNNING,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+        )
+        if updated:
+            claimed.append(pk)
+
+    return claimed
+
+
+def run_task(pk):
+    '''
+    Выполнение захваченной задачи с повтором при ошибке:
+    следующая попытка откладывается на TASKS_RETRY_DELAY * 2^(попытка-1)
+    '''
+    task = Task.objects.get(pk=pk)
+
+    try:
+        arguments = json.loads(task.arguments)
+        import_string(task.name)(*arguments['args'], **arguments['kwargs'])
+    except Exception:
+        task.last_error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            task.status = Task.FAILED
+            task.finished = timezone.now()
+        else:
+            delay = getattr(settings, 'TASKS_RETRY_DELAY', 10)
+            task.status = Task.QUEUED
+            task.run_after = timezone.now() + timedelta(
+                seconds=delay * 2 ** (task.attempts - 1)
+            )
+    else:
+        task.status = Task.DONE
+        task.finished = timezone.now()
+    finally:
+        task.locked_until = None
+
+    task.save(update_fields=['status', 'last_error', 'run_after',
+                             'locked_until', 'finished'])
+    return task.status
+
+
+def run_task_in_worker(pk):
+    '''
+    Обёртка для пула: у каждого потока своё соединение с базой,
+    которое нужно закрыть, как это делает Django после запроса
+    '''
+    try:
+        return run_task(pk)
+    finally:
+        connection.close()
+
+
+class Worker:
+    '''
+    Цикл воркера: захватывает задачи, пока в пуле есть свободные
+    места, и ждёт новых, опрашивая базу раз в poll_interval секунд
+    '''
+    def __init__(self, workers=4, pool='thread', poll_interval=1,
+                 visibility_timeout=None):
+        self.workers = workers
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+
+    def make_executor(self):
+        if self.pool == 'process':
+            # Дочерние процессы получают настроенный Django через fork,
+            # а вот унаследованные соединения с базой использовать нельзя
+            connections.close_all()
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('fork')
+            )
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def run(self, once=False):
+        running = set()
+
+        with self.make_executor() as executor:
+            while True:
+                free = self.workers - len(running)
+                if free:
+                    for pk in claim_tasks(free, self.visibility_timeout):
+                        running.add(executor.submit(run_task_in_worker, pk))
+
+                if once and not running:
+                    return
+
+                if running:
+                    _, running = wait(running, timeout=self.poll_interval,
+                                      return_when='FIRST_COMPLETED')
+                else:
+                    time.sleep(self.poll_interval)
@@ -0,0 +1,222 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django import template
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template import TemplateSyntaxError, VariableDoesNotExist
+
+register = template.Library()
+
+STATS_EVENTS = ('hits', 'stale', 'rebuilds')
+STATS_KEY_TEMPLATE = 'template.stale_cache.stats.%s.%s'
+LOCK_KEY_TEMPLATE = '%s.lock'
+
+# Рисовать фрагменты заново, не читая и не записывая кеш
+bypass = ContextVar('stale_cache_bypass', default=False)
+
+
+@contextmanager
+def bypass_fragment_cache():
+    '''
+    Страница, отрисованная внутри, содержит актуальные данные, даже
+    если фрагмент с тем же ключом лежит в кеше (выгрузка страниц
+    в HTML не должна закрепить устаревшую версию)
+    '''
+    token = bypass.set(True)
+    try:
+        yield
+    finally:
+        bypass.reset(token)
+
+
+# Счётчики копятся в памяти процесса и сбрасываются в кеш не чаще
+# раза в STALE_CACHE_STATS_INTERVAL секунд: запись в общий кеш на
+# каждое попадание выстроила бы все воркеры в очередь за блокировкой
+pending = Counter()
+pending_lock = threading.Lock()
+last_flush = time.monotonic()
+
+
+def count(cache_name, key):
+    with pending_lock:
+        pending[cache_name, key] += 1
+        due = (time.monotonic() - last_flush
+               >= getattr(settings, 'STALE_CACHE_STATS_INTERVAL', 10))
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    global last_flush
+
+    with pending_lock:
+        counts = dict(pending)
+        pending.clear()
+        last_flush = time.monotonic()
+
+    for (cache_name, key), delta in counts.items():
+        fragment_cache = caches[cache_name]
+        try:
+            fragment_cache.incr(key, delta)
+        except ValueError:
+            if not fragment_cache.add(key, delta, None):
+                fragment_cache.incr(key, delta)
+
+
+def get_stats(fragment_name, cache_name='default'):
+    '''
+    Счетчики фрагмента: сколько раз отдали свежую версию,
+    сколько раз - устаревшую и сколько раз перестраивали.
+    Накопленное этим процессом сбрасывается в кеш перед чтением,
+    остальные процессы - с задержкой до STALE_CACHE_STATS_INTERVAL
+    '''
+    flush_stats()
+
+    keys = {STATS_KEY_TEMPLATE % (fragment_name, event): event
+            for event in STATS_EVENTS}
+    values = caches[cache_name].get_many(keys.keys())
+
+    return {event: values.get(key, 0) for key, event in keys.items()}
+
+
+class StaleCacheNode(template.Node):
+    '''
+    То же, что и {% cache %}, но по истечении expire_time фрагмент
+    ещё STALE_CACHE_TTL секунд лежит в кеше. Пока один запрос его
+    перестраивает (под блокировкой в кеше), все остальные
+    получают устаревшую версию, а не бегут в базу все разом
+    '''
+    def __init__(self, nodelist, expire_time_var, fragment_name, vary_on,
+                 cache_name):
+        self.nodelist = nodelist
+        self.expire_time_var = expire_time_var
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.cache_name = cache_name
+
+    def get_expire_time(self, context):
+        try:
+            expire_time = self.expire_time_var.resolve(context)
+        except VariableDoesNotExist:
+            raise TemplateSyntaxError(
+                f'"stale_cache" tag got an unknown variable: '
+                f'{self.expire_time_var.var!r}'
+            )
+
+        if expire_time is None:
+            return None
+
+        try:
+            return int(expire_time)
+        except (ValueError, TypeError):
+            raise TemplateSyntaxError(
+                f'"stale_cache" tag got a non-integer timeout value: '
+                f'{expire_time!r}'
+            )
+
+    def get_cache_name(self, context):
+        if not self.cache_name:
+            try:
+                caches['template_fragments']
+                return 'template_fragments'
+            except InvalidCacheBackendError:
+                return 'default'
+
+        cache_name = self.cache_name.resolve(context)
+        try:
+            caches[cache_name]
+            return cache_name
+        except InvalidCacheBackendError:
+            raise TemplateSyntaxError(
+                f'Invalid cache name specified for stale_cache tag: '
+                f'{cache_name!r}'
+            )
+
+    def render(self, context):
+        if bypass.get():
+            return self.nodelist.render(context)
+
+        expire_time = self.get_expire_time(context)
+        cache_name = self.get_cache_name(context)
+        fragment_cache = caches[cache_name]
+
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        # Ключ тот же, что и у {% cache %}, поэтому инвалидация через
+        # make_template_fragment_key продолжает работать
+        cache_key = make_template_fragment_key(self.fragment_name, vary_on)
+
+        now = time.time()
+        entry = fragment_cache.get(cache_key)
+
+        if entry is not None:
+            value, fresh_until = entry
+            if fresh_until is None or now < fresh_until:
+                self.count(cache_name, 'hits')
+                return value
+
+        stale_ttl = getattr(settings, 'STALE_CACHE_TTL', 60)
+        lock_key = LOCK_KEY_TEMPLATE % cache_key
+        # Блокировка живёт не дольше stale_ttl: если перестраивающий
+        # процесс умер, следующий запрос подхватит работу
+        locked = fragment_cache.add(lock_key, 1, stale_ttl)
+
+        if not locked and entry is not None:
+            self.count(cache_name, 'stale')
+            return entry[0]
+
+        try:
+            value = self.nodelist.render(context)
+            self.count(cache_name, 'rebuilds')
+
+            if expire_time is None:
+                fragment_cache.set(cache_key, (value, None), None)
+            else:
+                fragment_cache.set(cache_key,
+                                   (value, now + expire_time),
+                                   expire_time + stale_ttl)
+        finally:
+            if locked:
+                fragment_cache.delete(lock_key)
+
+        return value
+
+    def count(self, cache_name, event):
+        fragment_name = self.fragment_name.strip('\'"')
+        count(cache_name, STATS_KEY_TEMPLATE % (fragment_name, event))
+
+
+@register.tag('stale_cache')
+def do_stale_cache(parser, token):
+    '''
+    Замена {% cache %} с теми же аргументами:
+
+        {% load stale_cache %}
+        {% stale_cache 20 'index_page' request.GET %}
+            ...
+        {% endstale_cache %}
+    '''
+    nodelist = parser.parse(('endstale_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+
+    if len(tokens) < 3:
+        raise TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 2 arguments.'
+        )
+
+    if len(tokens) > 3 and tokens[-1].startswith('using='):
+        cache_name = parser.compile_filter(tokens[-1][len('using='):])
+        tokens = tokens[:-1]
+    else:
+        cache_name = None
+
+    return StaleCacheNode(nodelist,
+                          parser.compile_filter(tokens[1]),
+                          tokens[2],
+                          [parser.compile_filter(t) for t in tokens[3:]],
+                          cache_name)
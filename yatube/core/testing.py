@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from copy import deepcopy
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def isolated_cache():
+    '''
+    Кеш в отдельном файле во временном каталоге: тесты чистят его
+    через cache.clear(), а общий с воркерами файл трогать нельзя.
+    Каталог удаляется на выходе
+    '''
+    directory = tempfile.mkdtemp(prefix='yatube-test-cache-')
+    caches = deepcopy(settings.CACHES)
+    for alias in caches:
+        caches[alias]['LOCATION'] = os.path.join(directory,
+                                                 f'{alias}.sqlite3')
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    '''
+    manage.py test с кешем из isolated_cache()
+    '''
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache = isolated_cache()
+        self.cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
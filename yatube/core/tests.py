@@ -1,8 +1,36 @@
+import shutil
+import tempfile
+import threading
+import time
 from http import HTTPStatus
+from os import makedirs, path
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
 from test_utils import Url
 
+from .admission import AdmissionControlMiddleware
+from .cache import SharedFileCache
+from .health import memo, run_probes
+from .lru import LRUCache
+from .middleware import user_cache_key
+from .models import StoredFile, Task
+from .paginator import CachedCountPaginator, bump_generation
+from .ratelimit import parse_rate, take_token
+from .static import IMMUTABLE_CACHE_CONTROL, StaticFilesMiddleware
+from .storage import ContentAddressedStorage
+from .tasks import claim_tasks, enqueue, run_task
+from .templatetags.stale_cache import get_stats, pending
+
 
 class TestErrorPages(TestCase):
     def test_404_page(self):
@@ -16,3 +44,814 @@ class TestErrorPages(TestCase):
         response = self.client.get(url.url)
 
         self.assertEqual(response.status_code, url.guest_status)
+
+
+User = get_user_model()
+TASK_CALLS = []
+
+
+def record_task(value):
+    TASK_CALLS.append(value)
+
+
+def failing_task():
+    raise RuntimeError('task failed')
+
+
+class TestSharedFileCache(TestCase):
+    '''
+        Тестирование общего между процессами кеша
+    '''
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.location = path.join(self.cache_dir, 'cache.sqlite3')
+        self.cache = SharedFileCache(self.location,
+                                     {'OPTIONS': {'MAX_ENTRIES': 3}})
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_shared_between_instances(self):
+        '''
+            Данные видны другому экземпляру с тем же файлом
+        '''
+        self.cache.set('key', {'value': 1})
+        other = SharedFileCache(self.location, {})
+
+        self.assertEqual(other.get('key'), {'value': 1})
+
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_and_expiry(self):
+        '''
+            add() не перезаписывает живой ключ, но занимает протухший
+        '''
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 1)
+
+        self.cache.set('key', 1, timeout=0)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 3))
+        self.assertEqual(self.cache.get('key'), 3)
+
+    def test_lru_eviction(self):
+        '''
+            При переполнении вытесняются давно не читанные ключи
+        '''
+        for i in range(3):
+            self.cache.set(f'key{i}', i)
+            self.cache._connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                (i, self.cache.make_key(f'key{i}'))
+            )
+
+        self.cache.get('key0')
+        self.cache.set('key3', 3)
+
+        self.assertEqual(self.cache.get('key0'), 0)
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertEqual(self.cache.get('key3'), 3)
+
+    def test_atomic_incr(self):
+        '''
+            Параллельные incr() не теряют обновлений
+        '''
+        self.cache.set('counter', 0)
+
+        def worker():
+            for _ in range(50):
+                self.cache.incr('counter')
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.cache.get('counter'), 200)
+
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+
+class TestStaleCacheTag(TestCase):
+    '''
+        Тестирование {% stale_cache %}
+    '''
+    template = Template('{% load stale_cache %}'
+                        '{% stale_cache 20 "fragment" %}'
+                        '{{ value }}'
+                        '{% endstale_cache %}')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        pending.clear()
+        self.cache_key = make_template_fragment_key('"fragment"')
+
+    def render(self, value):
+        return self.template.render(Context({'value': value}))
+
+    def expire(self):
+        value, _ = cache.get(self.cache_key)
+        cache.set(self.cache_key, (value, 0), 60)
+
+    def test_fresh_fragment(self):
+        '''
+            Свежий фрагмент берётся из кеша
+        '''
+        self.assertEqual(self.render('first'), 'first')
+        self.assertEqual(self.render('second'), 'first')
+        self.assertEqual(get_stats('fragment'),
+                         {'hits': 1, 'stale': 0, 'rebuilds': 1})
+
+    def test_stale_while_rebuilding(self):
+        '''
+            Пока фрагмент перестраивается - отдаётся устаревшая версия
+        '''
+        self.render('first')
+        self.expire()
+
+        cache.add(self.cache_key + '.lock', 1)
+        self.assertEqual(self.render('second'), 'first')
+
+        cache.delete(self.cache_key + '.lock')
+        self.assertEqual(self.render('second'), 'second')
+        self.assertEqual(get_stats('fragment'),
+                         {'hits': 0, 'stale': 1, 'rebuilds': 2})
+
+    @override_settings(STALE_CACHE_STATS_INTERVAL=60)
+    def test_stats_flushed_periodically(self):
+        '''
+            Попадание в свежий фрагмент не пишет в кеш, счетчики
+            копятся в процессе до сброса
+        '''
+        self.render('first')
+        # get_stats сбрасывает счетчики и заново отсчитывает интервал
+        get_stats('fragment')
+        stats_key = 'template.stale_cache.stats.fragment.hits'
+
+        self.render('first')
+        self.render('first')
+        self.assertIsNone(cache.get(stats_key))
+
+        self.assertEqual(get_stats('fragment')['hits'], 2)
+        self.assertEqual(cache.get(stats_key), 2)
+
+        with override_settings(STALE_CACHE_STATS_INTERVAL=0):
+            self.render('first')
+        self.assertEqual(cache.get(stats_key), 3)
+
+
+class TestCachedCountPaginator(TestCase):
+    '''
+        Тестирование паджинатора с кешируемым количеством объектов
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        User.objects.bulk_create([User(username=f'user{i}')
+                                  for i in range(5)])
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    @override_settings(PAGINATOR_CACHE_MIN_COUNT=1)
+    def test_count_cached_until_change(self):
+        '''
+            COUNT(*) берётся из кеша, пока модель не изменилась
+        '''
+        queryset = User.objects.order_by('pk')
+        self.assertEqual(CachedCountPaginator(queryset, 2).count, 5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCountPaginator(queryset, 2).count, 5)
+
+        # Пользователей лентами не считают, сигналы к ним не подключены
+        User.objects.create(username='new_user')
+        bump_generation(User)
+        self.assertEqual(CachedCountPaginator(queryset, 2).count, 6)
+
+    def test_small_count_not_cached(self):
+        '''
+            Маленькие выборки всегда считаются заново
+        '''
+        queryset = User.objects.order_by('pk')
+        CachedCountPaginator(queryset, 2).count
+
+        with self.assertNumQueries(1):
+            CachedCountPaginator(queryset, 2).count
+
+    def test_elided_page_range(self):
+        '''
+            Выводится только окно страниц вокруг текущей
+        '''
+        paginator = CachedCountPaginator(range(1000), 10)
+        ellipsis = CachedCountPaginator.ELLIPSIS
+
+        self.assertEqual(
+            list(paginator.get_elided_page_range(50, on_each_side=2)),
+            [1, 2, ellipsis, 48, 49, 50, 51, 52, ellipsis, 99, 100]
+        )
+        self.assertEqual(
+            list(paginator.get_elided_page_range(1, on_each_side=2)),
+            [1, 2, 3, ellipsis, 99, 100]
+        )
+
+
+class TestCachedAuthentication(TestCase):
+    '''
+        Тестирование кеширования пользователя из сессии
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user(username='cached',
+                                            password='password')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(TestCachedAuthentication.user)
+
+    def get_user(self):
+        return self.client.get(reverse('about:author')).context['user']
+
+    def test_user_from_cache(self):
+        '''
+            Повторный запрос не ходит в базу за пользователем
+        '''
+        self.get_user()
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_user(), self.user)
+
+    def test_invalidation_on_edit_and_password_change(self):
+        '''
+            Изменение пользователя и смена пароля сбрасывают кеш
+        '''
+        self.get_user()
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Changed'
+        user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        self.assertEqual(self.get_user().first_name, 'Changed')
+
+        user.set_password('new_password')
+        user.save()
+        self.assertFalse(self.get_user().is_authenticated)
+
+    def test_invalidation_on_logout(self):
+        '''
+            Выход сбрасывает кеш
+        '''
+        self.get_user()
+        self.client.get(reverse('users:logout'))
+
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+
+class TestRateLimit(TestCase):
+    '''
+        Тестирование ограничения частоты запросов
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user(username='limited')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(TestRateLimit.user)
+
+    def test_parse_rate(self):
+        '''
+            Разбор частоты из настроек
+        '''
+        self.assertEqual(parse_rate('20/h'), (20, 3600))
+        self.assertEqual(parse_rate('5/10m'), (5, 600))
+
+    def test_bucket_refills(self):
+        '''
+            Токены кончаются и появляются по одному за period / limit
+        '''
+        now = 1000.0
+        results = [take_token('view', 'ident', 2, 60, now) for _ in range(3)]
+
+        self.assertEqual(results[:2], [0, 0])
+        self.assertEqual(results[2], 30)
+        self.assertEqual(take_token('view', 'ident', 2, 60, now + 30), 0)
+        self.assertEqual(take_token('view', 'ident', 2, 60, now + 30), 30)
+
+    def test_no_burst_after_idle(self):
+        '''
+            За простой копится не больше limit токенов
+        '''
+        now = 1000.0
+        take_token('view', 'ident', 2, 60, now)
+        results = [take_token('view', 'ident', 2, 60, now + 3600)
+                   for _ in range(3)]
+
+        self.assertEqual(results, [0, 0, 30])
+
+    @override_settings(RATE_LIMITS={'posts:post_create': '2/m'})
+    def test_too_many_requests(self):
+        '''
+            Сверх лимита - 429 с Retry-After, GET формы не считается
+        '''
+        url = reverse('posts:post_create')
+        self.client.get(url)
+        for _ in range(2):
+            self.client.post(url, {'text': 'Пост'})
+
+        response = self.client.post(url, {'text': 'Пост'})
+
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertTemplateUsed(response, 'core/429.html')
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.user.posts.count(), 2)
+
+    @override_settings(RATE_LIMITS={'posts:post_create': '1/m'})
+    def test_limits_are_per_user(self):
+        '''
+            У каждого пользователя своя корзина
+        '''
+        url = reverse('posts:post_create')
+        self.client.post(url, {'text': 'Пост'})
+
+        other = Client()
+        other.force_login(User.objects.create_user(username='other'))
+
+        self.assertEqual(other.post(url, {'text': 'Пост'}).status_code,
+                         HTTPStatus.FOUND)
+
+
+class TestAdmissionControl(TestCase):
+    '''
+        Тестирование сброса нагрузки
+    '''
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.factory = RequestFactory()
+        self.calls = 0
+        self.middleware = AdmissionControlMiddleware(self.get_response)
+
+    def get_response(self, request):
+        self.calls += 1
+        response = HttpResponse(f'page {self.calls}')
+        response['X-Frame-Options'] = 'SAMEORIGIN'
+        return response
+
+    def overloaded(self, path, **headers):
+        self.middleware.in_flight = 100
+        return self.middleware(self.factory.get(path, **headers))
+
+    def test_normal_load(self):
+        '''
+            Без нагрузки запросы проходят, счётчик возвращается к нулю
+        '''
+        response = self.middleware(self.factory.get('/?page=100'))
+
+        self.assertEqual(response.content, b'page 1')
+        self.assertEqual(self.middleware.in_flight, 0)
+
+    def test_stored_page_for_anonymous(self):
+        '''
+            Под нагрузкой аноним получает сохранённую копию страницы
+        '''
+        self.middleware(self.factory.get('/'))
+        response = self.overloaded('/')
+
+        self.assertEqual(response.content, b'page 1')
+        self.assertIn('Age', response)
+        self.assertEqual(response['X-Frame-Options'], 'SAMEORIGIN')
+        self.assertEqual(response['Content-Type'],
+                         'text/html; charset=utf-8')
+        self.assertEqual(self.calls, 1)
+
+    def test_no_stored_page_for_user(self):
+        '''
+            Вошедшему пользователю копия не отдаётся
+        '''
+        self.middleware(self.factory.get('/'))
+        request = self.factory.get('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'session'
+        self.middleware.in_flight = 100
+
+        self.assertEqual(self.middleware(request).content, b'page 2')
+
+    def test_low_priority_rejected(self):
+        '''
+            Глубокие страницы и списки админки получают 503
+        '''
+        for url in ('/?page=100', '/admin/posts/post/'):
+            with self.subTest(url=url):
+                response = self.overloaded(url)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.SERVICE_UNAVAILABLE)
+                self.assertIn('Retry-After', response)
+
+        self.assertEqual(self.overloaded('/?page=2').status_code,
+                         HTTPStatus.OK)
+
+    def test_queue_wait(self):
+        '''
+            Долгое ожидание в очереди прокси - тоже перегрузка
+        '''
+        started = f't={time.time() - 60:.3f}'
+        request = self.factory.get('/?page=100', HTTP_X_REQUEST_START=started)
+
+        self.assertEqual(self.middleware(request).status_code,
+                         HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+class TestHealth(TestCase):
+    '''
+        Тестирование проверок живости и готовности
+    '''
+    def setUp(self):
+        super().setUp()
+        memo['result'] = None
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+
+    def tearDown(self):
+        super().tearDown()
+        self.settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_liveness(self):
+        '''
+            Живость не зависит от внешних сервисов
+        '''
+        response = self.client.get(reverse('health_live'))
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+    def test_readiness(self):
+        '''
+            Все проверки проходят, для каждой есть время ответа
+        '''
+        response = self.client.get(reverse('health_ready'))
+        result = response.json()
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(set(result['checks']),
+                         {'database', 'cache', 'media', 'tasks'})
+        for check in result['checks'].values():
+            self.assertEqual(check['status'], 'ok')
+            self.assertIn('latency_ms', check)
+
+    def test_readiness_memoized(self):
+        '''
+            Повторный запрос отдаёт запомненный результат
+        '''
+        first = self.client.get(reverse('health_ready')).json()
+        second = self.client.get(reverse('health_ready')).json()
+
+        self.assertEqual(first, second)
+
+    @override_settings(HEALTH_MAX_TASK_LAG=60)
+    def test_task_backlog(self):
+        '''
+            Давно ждущие задачи делают сервис неготовым
+        '''
+        enqueue(record_task, 'value', delay=-120)
+        response = self.client.get(reverse('health_ready'))
+
+        self.assertEqual(response.status_code, HTTPStatus.SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json()['checks']['tasks']['status'],
+                         'fail')
+
+    def test_probe_timeout(self):
+        '''
+            Зависшая проверка проваливается по таймауту
+        '''
+        result = run_probes({'slow': lambda: time.sleep(0.5)}, timeout=0.05)
+
+        self.assertEqual(result['status'], 'fail')
+        self.assertEqual(result['checks']['slow']['error'], 'Таймаут')
+
+
+class TestLRUCache(TestCase):
+    '''
+        Тестирование кеша в памяти процесса
+    '''
+    def setUp(self):
+        super().setUp()
+        self.loads = []
+        self.cache = LRUCache(maxsize=2, ttl=60, negative_ttl=0)
+
+    def load(self, value):
+        self.loads.append(value)
+        return value
+
+    def test_eviction(self):
+        '''
+            Вытесняется давно не использованная запись
+        '''
+        self.cache.get_or_load('a', lambda: self.load(1))
+        self.cache.get_or_load('b', lambda: self.load(2))
+        self.cache.get_or_load('a', lambda: self.load(1))
+        self.cache.get_or_load('c', lambda: self.load(3))
+
+        self.assertEqual(list(self.cache.entries), ['a', 'c'])
+        self.assertEqual(self.loads, [1, 2, 3])
+
+    def test_negative_ttl(self):
+        '''
+            Отсутствие живёт negative_ttl секунд
+        '''
+        self.cache.get_or_load('missing', lambda: self.load(None))
+        self.cache.get_or_load('missing', lambda: self.load(None))
+
+        self.assertEqual(self.loads, [None, None])
+
+    def test_invalidate_where(self):
+        '''
+            Запись можно сбросить по значению
+        '''
+        self.cache.get_or_load('a', lambda: self.load(1))
+        self.cache.invalidate_where(lambda value: value == 1)
+        self.cache.get_or_load('a', lambda: self.load(1))
+
+        self.assertEqual(self.loads, [1, 1])
+
+
+class TestStaticFiles(TestCase):
+    '''
+        Тестирование сборки и раздачи статики
+    '''
+    css = b'body { color: red; }\n' * 50
+
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.source = path.join(self.temp_dir, 'source')
+        self.root = path.join(self.temp_dir, 'root')
+        makedirs(path.join(self.source, 'css'))
+        with open(path.join(self.source, 'css', 'style.css'), 'wb') as f:
+            f.write(self.css)
+
+        self.settings = override_settings(STATICFILES_DIRS=[self.source],
+                                          STATIC_ROOT=self.root)
+        self.settings.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+        self.middleware = StaticFilesMiddleware(self.application)
+
+    def tearDown(self):
+        super().tearDown()
+        self.settings.disable()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def application(self, environ, start_response):
+        start_response('200 OK', [])
+        return [b'django']
+
+    def request(self, url, **environ):
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        environ.update(PATH_INFO=url, REQUEST_METHOD='GET')
+        response['body'] = b''.join(self.middleware(environ, start_response))
+        return response
+
+    def hashed_url(self):
+        staticfiles_storage.load_manifest()
+        return '/static/' + staticfiles_storage.stored_name('css/style.css')
+
+    def test_hashed_and_compressed_files(self):
+        '''
+            collectstatic пишет файл с хешем и сжатый вариант
+        '''
+        url = self.hashed_url()
+        self.assertNotEqual(url, '/static/css/style.css')
+        self.assertTrue(path.isfile(path.join(self.root,
+                                              url[len('/static/'):] + '.gz')))
+
+    def test_serving(self):
+        '''
+            Раздача с вечным кешем, ETag и выбором сжатого варианта
+        '''
+        url = self.hashed_url()
+
+        response = self.request(url)
+        self.assertEqual(response['body'], self.css)
+        self.assertEqual(response['headers']['Cache-Control'],
+                         IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['headers']['Vary'], 'Accept-Encoding')
+
+        compressed = self.request(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['headers']['Content-Encoding'], 'gzip')
+        self.assertLess(len(compressed['body']), len(self.css))
+
+        not_modified = self.request(
+            url, HTTP_IF_NONE_MATCH=response['headers']['ETag']
+        )
+        self.assertTrue(not_modified['status'].startswith('304'))
+
+    def test_passthrough(self):
+        '''
+            Всё, чего нет в STATIC_ROOT, обрабатывает Django
+        '''
+        for url in ('/static/missing.css', '/static/../settings.py', '/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.request(url)['body'], b'django')
+
+
+class TestContentAddressedStorage(TestCase):
+    '''
+        Тестирование хранилища с именами по хешу содержимого
+    '''
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.media_root)
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_sharded_name(self):
+        '''
+            Имя - хеш содержимого в каталогах-шардах
+        '''
+        name = self.storage.save('posts/Photo.JPG', ContentFile(b'image'))
+        directory, first, second, filename = name.split('/')
+
+        self.assertEqual(directory, 'posts')
+        self.assertEqual(len(filename), 64 + len('.jpg'))
+        self.assertTrue(filename.startswith(first + second))
+        self.assertTrue(filename.endswith('.jpg'))
+        self.assertTrue(self.storage.exists(name))
+
+    def test_deduplication(self):
+        '''
+            Одинаковые загрузки - один файл, удаляется с последней ссылкой
+        '''
+        first = self.storage.save('posts/a.gif', ContentFile(b'same'))
+        second = self.storage.save('posts/b.gif', ContentFile(b'same'))
+
+        self.assertEqual(first, second)
+        self.assertEqual(StoredFile.objects.get(name=first).references, 2)
+
+        self.storage.delete(first)
+        self.assertTrue(self.storage.exists(first))
+
+        self.storage.delete(first)
+        self.assertFalse(self.storage.exists(first))
+        self.assertFalse(StoredFile.objects.filter(name=first).exists())
+
+    def test_legacy_names(self):
+        '''
+            Файлы со старыми именами читаются и удаляются
+        '''
+        makedirs(path.join(self.media_root, 'posts'))
+        with open(path.join(self.media_root, 'posts', 'old.gif'), 'wb') as f:
+            f.write(b'old')
+
+        with self.storage.open('posts/old.gif') as file:
+            self.assertEqual(file.read(), b'old')
+
+        self.storage.delete('posts/old.gif')
+        self.assertFalse(self.storage.exists('posts/old.gif'))
+
+
+class TestServeMedia(TestCase):
+    '''
+        Тестирование раздачи загруженных файлов
+    '''
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        makedirs(path.join(self.media_root, 'posts'))
+        with open(path.join(self.media_root, 'posts', 'file.gif'), 'wb') as f:
+            f.write(self.content)
+
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.url = reverse('media', kwargs={'path': 'posts/file.gif'})
+
+    def tearDown(self):
+        super().tearDown()
+        self.settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_full_and_conditional(self):
+        '''
+            Файл отдаётся целиком, повторный запрос с ETag получает 304
+        '''
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/gif')
+
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_range(self):
+        '''
+            Запрос диапазона байт
+        '''
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content),
+                         self.content[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content),
+                         self.content[-4:])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect')
+    def test_accel_redirect(self):
+        '''
+            В режиме X-Accel-Redirect тело отдаёт прокси
+        '''
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/posts/file.gif')
+        self.assertEqual(response.content, b'')
+
+    def test_missing_and_traversal(self):
+        '''
+            Несуществующие файлы и выход за MEDIA_ROOT - 404
+        '''
+        for url in ('/media/posts/missing.gif', '/media/../settings.py'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code,
+                                 HTTPStatus.NOT_FOUND)
+
+
+class TestTaskQueue(TestCase):
+    '''
+        Тестирование очереди фоновых задач
+    '''
+    def setUp(self):
+        super().setUp()
+        TASK_CALLS.clear()
+
+    def test_priority_and_run(self):
+        '''
+            Задачи захватываются по приоритету и выполняются
+        '''
+        low = enqueue(record_task, 'low')
+        high = enqueue('core.tests.record_task', 'high', priority=10)
+        enqueue(record_task, 'delayed', delay=60)
+
+        claimed = claim_tasks(10)
+        self.assertEqual(claimed, [high.pk, low.pk])
+        self.assertEqual(claim_tasks(10), [])
+
+        for pk in claimed:
+            self.assertEqual(run_task(pk), Task.DONE)
+        self.assertEqual(TASK_CALLS, ['high', 'low'])
+
+    def test_retries(self):
+        '''
+            Упавшая задача повторяется, пока не кончатся попытки
+        '''
+        task = enqueue(failing_task, max_attempts=2)
+
+        for expected in (Task.QUEUED, Task.FAILED):
+            Task.objects.filter(pk=task.pk).update(run_after=task.created)
+            (pk,) = claim_tasks(1)
+            self.assertEqual(run_task(pk), expected)
+
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 2)
+        self.assertIn('task failed', task.last_error)
+
+    def test_visibility_timeout(self):
+        '''
+            Задачу умершего воркера забирает другой
+        '''
+        task = enqueue(record_task, 'value')
+        self.assertEqual(claim_tasks(1, visibility_timeout=60), [task.pk])
+        self.assertEqual(claim_tasks(1), [])
+
+        Task.objects.filter(pk=task.pk).update(locked_until=task.created)
+        self.assertEqual(claim_tasks(1), [task.pk])
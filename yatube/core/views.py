@@ -1,6 +1,22 @@
+import mimetypes
+import os
+import re
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         JsonResponse, StreamingHttpResponse)
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from .health import get_readiness
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
 
 
 def page_not_found(request, exception):
@@ -26,3 +42,149 @@ def forbidden(request, exception):
     return render(request,
                   'core/403.html',
                   status=HTTPStatus.FORBIDDEN)
+
+
+def parse_range(header, size):
+    '''
+    Разбор заголовка Range с единственным диапазоном байт
+
+    Возвращает (start, end) включительно, None если заголовок
+    не задан или не поддерживается (тогда отдаём файл целиком)
+    и ValueError если диапазон не пересекается с файлом
+    '''
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # bytes=-500 - последние 500 байт
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+
+    return start, end
+
+
+def read_range(file, start, length, chunk_size=64 * 1024):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    '''
+    Раздача загруженных файлов (картинок постов и миниатюр)
+
+    Поддерживает ETag/Last-Modified с условными запросами и Range.
+    При MEDIA_SERVE_MODE = 'x-accel-redirect' или 'x-sendfile'
+    сами байты не отдаёт, а поручает это фронтовому прокси
+    '''
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    stat = os.stat(full_path)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request,
+                                        etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        response = build_media_response(request, path, full_path,
+                                        stat.st_size, etag)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True,
+                        max_age=getattr(settings, 'MEDIA_CACHE_MAX_AGE', 0))
+
+    return response
+
+
+def build_media_response(request, path, full_path, size, etag):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'stream')
+
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX',
+                         '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + path
+        return response
+
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    # If-Range: диапазон отдаём, только если файл не поменялся
+    if_range = request.META.get('HTTP_IF_RANGE')
+    range_header = request.META.get('HTTP_RANGE', '')
+    if if_range and if_range != etag:
+        range_header = ''
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(
+            status=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'),
+                                content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            read_range(open(full_path, 'rb'), start, length),
+            status=HTTPStatus.PARTIAL_CONTENT,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+
+    return response
+
+
+@never_cache
+def liveness(request):
+    '''
+    Процесс жив и обрабатывает запросы - без обращения к зависимостям
+    '''
+    return JsonResponse({'status': 'ok'})
+
+
+@never_cache
+def readiness(request):
+    '''
+    Готовность принимать трафик: база, кеш, запись в медиа и очередь
+    фоновых задач с временем ответа каждой проверки
+    '''
+    result = get_readiness()
+    status = (HTTPStatus.OK if result['status'] == 'ok'
+              else HTTPStatus.SERVICE_UNAVAILABLE)
+    return JsonResponse(result, status=status)
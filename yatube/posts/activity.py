@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (ArchivedComment, ArchivedPost, Comment, DailyActivity,
+                     Follow, Post)
+
+FIELDS = ('posts', 'comments', 'followers')
+
+
+def record(kind, object_id, day, **deltas):
+    '''
+    Изменение дневных счетчиков: record(AUTHOR, 1, day, posts=1)
+    '''
+    rows = DailyActivity.objects.filter(kind=kind,
+                                        object_id=object_id,
+                                        day=day)
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+
+    if not rows.update(**changes):
+        try:
+            with transaction.atomic():
+                DailyActivity.objects.create(kind=kind,
+                                             object_id=object_id,
+                                             day=day,
+                                             **deltas)
+        except IntegrityError:
+            rows.update(**changes)
+
+
+def count_post(post, delta):
+    day = timezone.localdate(post.pub_date)
+    record(DailyActivity.AUTHOR, post.author_id, day, posts=delta)
+    if post.group_id:
+        record(DailyActivity.GROUP, post.group_id, day, posts=delta)
+
+
+def count_comment(comment, delta):
+    day = timezone.localdate(comment.created)
+    record(DailyActivity.AUTHOR, comment.author_id, day, comments=delta)
+
+    group_id = (Post.objects.filter(pk=comment.post_id)
+                            .values_list('group_id', flat=True)
+                            .first())
+    if group_id:
+        record(DailyActivity.GROUP, group_id, day, comments=delta)
+
+
+def count_follow(follow, delta):
+    record(DailyActivity.AUTHOR, follow.author_id,
+           timezone.localdate(follow.created), followers=delta)
+
+
+COUNTERS = {Post: count_post, Comment: count_comment, Follow: count_follow}
+
+
+def on_saved(sender, instance, created, **kwargs):
+    if created:
+        COUNTERS[sender](instance, 1)
+
+
+def on_deleted(sender, instance, **kwargs):
+    COUNTERS[sender](instance, -1)
+
+
+def backfill(days=None):
+    '''
+    Пересборка сводок агрегирующими запросами по исходным таблицам
+
+    days - пересобрать только последние N дней, иначе всю историю.
+    Возвращает количество записанных строк
+    '''
+    since = timezone.localdate() - timedelta(days=days - 1) if days else None
+    sources = (
+        (Post, 'pub_date', 'author_id', DailyActivity.AUTHOR, 'posts'),
+        (Post, 'pub_date', 'group_id', DailyActivity.GROUP, 'posts'),
+        (Comment, 'created', 'author_id', DailyActivity.AUTHOR, 'comments'),
+        (Comment, 'created', 'post__group_id', DailyActivity.GROUP,
+         'comments'),
+        (Follow, 'created', 'author_id', DailyActivity.AUTHOR, 'followers'),
+        # Архив (posts.archive) - те же посты и комментарии
+        (ArchivedPost, 'pub_date', 'author_id', DailyActivity.AUTHOR,
+         'posts'),
+        (ArchivedPost, 'pub_date', 'group_id', DailyActivity.GROUP, 'posts'),
+        (ArchivedComment, 'created', 'author_id', DailyActivity.AUTHOR,
+         'comments'),
+        (ArchivedComment, 'created', 'post__group_id', DailyActivity.GROUP,
+         'comments'),
+    )
+
+    rows = defaultdict(dict)
+    for model, date_field, key_field, kind, field in sources:
+        queryset = model.objects.exclude(**{f'{key_field}__isnull': True})
+        if since:
+            queryset = queryset.filter(**{f'{date_field}__date__gte': since})
+
+        counts = (queryset
+                  .annotate(day=TruncDate(date_field))
+                  .order_by()
+                  .values_list(key_field, 'day')
+                  .annotate(count=Count('pk')))
+        for object_id, day, count in counts:
+            row = rows[(kind, object_id, day)]
+            row[field] = row.get(field, 0) + count
+
+    objects = [DailyActivity(kind=kind, object_id=object_id, day=day,
+                             **counts)
+               for (kind, object_id, day), counts in rows.items()]
+
+    with transaction.atomic():
+        existing = DailyActivity.objects.all()
+        if since:
+            existing = existing.filter(day__gte=since)
+        existing.delete()
+        DailyActivity.objects.bulk_create(objects, batch_size=500)
+
+    return len(objects)
+
+
+def get_activity(kind, object_id, days=30):
+    '''
+    Данные для графика за последние days дней одним запросом:
+    по строке на каждый день, включая дни без активности
+    '''
+    today = timezone.localdate()
+    since = today - timedelta(days=days - 1)
+
+    stored = {row['day']: row for row in
+              DailyActivity.objects
+              .filter(kind=kind, object_id=object_id, day__gte=since)
+              .values('day', *FIELDS)}
+
+    activity = []
+    for offset in range(days):
+        day = since + timedelta(days=offset)
+        row = stored.get(day, {})
+        counts = {field: row.get(field, 0) for field in FIELDS}
+        activity.append({'day': day,
+                         'total': sum(counts.values()),
+                         **counts})
+
+    peak = max(day['total'] for day in activity) or 1
+    for day in activity:
+        day['height'] = round(day['total'] * 100 / peak)
+
+    return activity
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Post, Group
+from .deletion import delete_group
+from .models import ArchivedPost, Deletion, Group, Post
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -11,5 +12,30 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = ('group',)
 
 
+class ArchivedPostAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'text', 'pub_date', 'author', 'group', 'archived')
+    search_fields = ('text',)
+    list_filter = ('pub_date',)
+    empty_value_display = '-пусто-'
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('title', 'slug', 'hidden')
+    actions = ('delete_in_background',)
+
+    def delete_in_background(self, request, queryset):
+        for group in queryset.filter(hidden=False):
+            delete_group(group)
+    delete_in_background.short_description = 'Удалить в фоне'
+
+
+class DeletionAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'name', 'stage', 'removed', 'created',
+                    'finished')
+    list_filter = ('kind',)
+
+
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(ArchivedPost, ArchivedPostAdmin)
+admin.site.register(Group, GroupAdmin)
+admin.site.register(Deletion, DeletionAdmin)
@@ -1,5 +1,78 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from core.paginator import bump_generation
+
+        from . import (activity, export, follows, images, lookups, sitemaps,
+                       trending)
+
+        # Модели, которые считают паджинаторы лент (CachedCountPaginator)
+        for model in ('posts.Post', 'posts.ArchivedPost', 'posts.Follow'):
+            for event, signal in (('saved', post_save),
+                                  ('deleted', post_delete)):
+                signal.connect(bump_generation, sender=model,
+                               dispatch_uid=f'paginator_{event}_{model}')
+
+        post_save.connect(trending.on_post_saved,
+                          sender='posts.Post',
+                          dispatch_uid='trending_post_saved')
+        post_save.connect(trending.on_comment_saved,
+                          sender='posts.Comment',
+                          dispatch_uid='trending_comment_saved')
+        post_delete.connect(trending.on_post_deleted,
+                            sender='posts.Post',
+                            dispatch_uid='trending_post_deleted')
+
+        # Архивирование переносит пост без сигналов, поэтому картинку
+        # освобождает только настоящее удаление
+        for model in ('posts.Post', 'posts.ArchivedPost'):
+            post_delete.connect(images.on_post_deleted,
+                                sender=model,
+                                dispatch_uid=f'images_deleted_{model}')
+
+        for model in ('posts.Post', 'posts.Comment', 'posts.Follow'):
+            post_save.connect(activity.on_saved,
+                              sender=model,
+                              dispatch_uid=f'activity_saved_{model}')
+            post_delete.connect(activity.on_deleted,
+                                sender=model,
+                                dispatch_uid=f'activity_deleted_{model}')
+
+        post_save.connect(follows.invalidate_followed_authors,
+                          sender='posts.Follow',
+                          dispatch_uid='followed_authors_saved')
+        post_delete.connect(follows.invalidate_followed_authors,
+                            sender='posts.Follow',
+                            dispatch_uid='followed_authors_deleted')
+
+        User = get_user_model()
+        for event, signal in (('saved', post_save),
+                              ('deleted', post_delete)):
+            signal.connect(lookups.invalidate_user, sender=User,
+                           dispatch_uid=f'lookups_user_{event}')
+            signal.connect(lookups.invalidate_group, sender='posts.Group',
+                           dispatch_uid=f'lookups_group_{event}')
+
+            # Журнал страниц для export_static_site
+            signal.connect(export.on_post_changed, sender='posts.Post',
+                           dispatch_uid=f'export_post_{event}')
+            signal.connect(export.on_comment_changed, sender='posts.Comment',
+                           dispatch_uid=f'export_comment_{event}')
+            signal.connect(export.on_group_changed, sender='posts.Group',
+                           dispatch_uid=f'export_group_{event}')
+            signal.connect(export.on_user_changed, sender=User,
+                           dispatch_uid=f'export_user_{event}')
+
+            # Устаревшие шарды карты сайта
+            signal.connect(sitemaps.on_post_changed, sender='posts.Post',
+                           dispatch_uid=f'sitemap_post_{event}')
+            signal.connect(sitemaps.on_group_changed, sender='posts.Group',
+                           dispatch_uid=f'sitemap_group_{event}')
+            signal.connect(sitemaps.on_user_changed, sender=User,
+                           dispatch_uid=f'sitemap_user_{event}')
@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from core.paginator import bump_generation, cached_count
+
+from .models import ArchivedComment, ArchivedPost, Comment, Post
+
+
+def option(name):
+    defaults = {
+        'POST_ARCHIVE_AFTER_DAYS': 365,
+        'POST_ARCHIVE_BATCH_SIZE': 500,
+    }
+    return getattr(settings, name, defaults[name])
+
+
+def copy(instance, model):
+    '''
+    Экземпляр model с теми же значениями полей, что у instance
+    '''
+    return model(**{field.attname: getattr(instance, field.attname)
+                    for field in model._meta.concrete_fields
+                    if hasattr(instance, field.attname)})
+
+
+def archive_batch(before, batch_size):
+    '''
+    Перенос пачки постов, опубликованных раньше before, вместе
+    с комментариями в архивные таблицы одной транзакцией.
+    Возвращает количество перенесённых постов
+    '''
+    with transaction.atomic():
+        posts = list(Post.objects.filter(pub_date__lt=before)
+                                 .select_for_update()
+                                 .order_by('pk')[:batch_size])
+        if not posts:
+            return 0
+
+        pks = [post.pk for post in posts]
+        comments = Comment.objects.filter(post_id__in=pks)
+
+        ArchivedPost.objects.bulk_create(
+            [copy(post, ArchivedPost) for post in posts]
+        )
+        ArchivedComment.objects.bulk_create(
+            [copy(comment, ArchivedComment) for comment in comments]
+        )
+
+        # Удаляем без сборщика каскада и сигналов: пост не удалён,
+        # а переехал, и сводки активности (posts.activity) уменьшать
+        # нельзя. Других ссылок на Post и Comment кроме комментариев нет
+        comments._raw_delete(comments.db)
+        posts = Post.objects.filter(pk__in=pks)
+        posts._raw_delete(posts.db)
+
+    bump_generation(Post)
+    bump_generation(ArchivedPost)
+
+    return len(pks)
+
+
+def archive_posts(days=None, batch_size=None):
+    '''
+    Перенос в архив всех постов старше days дней
+    '''
+    days = days or option('POST_ARCHIVE_AFTER_DAYS')
+    batch_size = batch_size or option('POST_ARCHIVE_BATCH_SIZE')
+    before = timezone.now() - timedelta(days=days)
+
+    archived = 0
+    while True:
+        moved = archive_batch(before, batch_size)
+        if not moved:
+            return archived
+        archived += moved
+
+
+class ArchiveChain:
+    '''
+    Посты автора для паджинатора: сначала из основной таблицы, затем
+    из архива. В архиве только посты старше тех, что остались в Post,
+    поэтому порядок по дате не нарушается (кроме старых постов, ещё
+    не дождавшихся очередного запуска archive_posts)
+
+    Обе части считаются через кеш паджинатора (core.paginator),
+    каждая по поколению своей модели
+    '''
+    def __init__(self, recent, archived):
+        self.recent = recent
+        self.archived = archived
+
+    @cached_property
+    def recent_count(self):
+        return cached_count(self.recent)
+
+    def count(self):
+        return self.recent_count + cached_count(self.archived)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop = index.start or 0, index.stop
+        split = self.recent_count
+
+        posts = []
+        if start < split:
+            posts.extend(self.recent[start:stop])
+        if stop is None or stop > split:
+            posts.extend(self.archived[max(start - split, 0):
+                                       None if stop is None else stop - split])
+        return posts
@@ -0,0 +1,154 @@
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from sorl.thumbnail import default, delete as delete_thumbnails
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.models import StoredFile
+
+from .models import ArchivedPost, Post
+
+
+def walk(root, directory=''):
+    '''
+    Обход каталога через os.scandir без построения списка всех
+    файлов: (имя относительно MEDIA_ROOT, mtime) по одному
+    '''
+    try:
+        entries = os.scandir(os.path.join(root, directory))
+    except FileNotFoundError:
+        return
+
+    with entries:
+        for entry in entries:
+            name = f'{directory}/{entry.name}' if directory else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(root, name)
+            elif entry.is_file(follow_symlinks=False):
+                yield name, entry.stat().st_mtime
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Collector:
+    '''
+    Поиск и удаление картинок, на которые не ссылается ни один пост,
+    и миниатюр, о которых не знает хранилище sorl-thumbnail
+
+    Файлы моложе min_age секунд не трогаем: картинка сохраняется
+    на диск раньше, чем пост в базу. Удаляем не быстрее rate файлов
+    в секунду, при dry_run только сообщаем
+    '''
+    def __init__(self, batch_size=500, min_age=60 * 60, rate=None,
+                 dry_run=False, stdout=None):
+        self.batch_size = batch_size
+        self.min_age = min_age
+        self.rate = rate
+        self.dry_run = dry_run
+        self.stdout = stdout
+        self.root = settings.MEDIA_ROOT
+        self.storage = Post._meta.get_field('image').storage
+        self.deleted = 0
+
+    def candidates(self, directory):
+        files = walk(self.root, directory)
+        return batches((name for name, mtime in files
+                        if mtime < self.deadline),
+                       self.batch_size)
+
+    @property
+    def deadline(self):
+        return time.time() - self.min_age
+
+    def collect_images(self):
+        upload_to = Post._meta.get_field('image').upload_to.strip('/')
+
+        for batch in self.candidates(upload_to):
+            orphans = set(batch) - self.used_images(batch)
+            for name in sorted(orphans):
+                self.delete(name, self.delete_image)
+
+    def used_images(self, names):
+        used = set()
+        for model in (Post, ArchivedPost):
+            used.update(model.objects.filter(image__in=names)
+                                     .values_list('image', flat=True))
+        return used
+
+    def delete_image(self, name):
+        # С --rate между проверкой пачки и удалением проходит время:
+        # за него файл могли загрузить повторно (хранилище тогда
+        # обновляет mtime) и сослаться на него из поста. Поэтому
+        # непосредственно перед удалением проверяем ещё раз
+        path = os.path.join(self.root, name)
+        if (os.stat(path).st_mtime >= self.deadline
+                or self.used_images([name])):
+            return False
+
+        # Вместе с картинкой уходят её миниатюры и записи о них
+        delete_thumbnails(ImageFile(name, self.storage), delete_file=False)
+        os.remove(path)
+        StoredFile.objects.filter(name=name).delete()
+        return True
+
+    def collect_thumbnails(self):
+        '''
+        Миниатюры, потерявшие запись в хранилище sorl-thumbnail.
+        Проверяются пачкой одним запросом к его таблице, поэтому
+        только для KVStore на базе данных
+        '''
+        if not isinstance(default.kvstore, KVStore):
+            return
+
+        prefix = thumbnail_settings.THUMBNAIL_PREFIX.strip('/')
+        for batch in self.candidates(prefix):
+            keys = {add_prefix(ImageFile(name, default.storage).key): name
+                    for name in batch}
+            known = set(KVStoreModel.objects.filter(key__in=keys)
+                                            .values_list('key', flat=True))
+
+            for key, name in keys.items():
+                if key not in known:
+                    self.delete(name, self.delete_thumbnail)
+
+    def delete_thumbnail(self, name):
+        os.remove(os.path.join(self.root, name))
+        return True
+
+    def delete(self, name, remove):
+        if self.dry_run:
+            self.report(name)
+            return
+
+        try:
+            removed = remove(name)
+        except FileNotFoundError:
+            return
+
+        if removed:
+            self.report(name)
+            if self.rate:
+                time.sleep(1 / self.rate)
+
+    def report(self, name):
+        if self.stdout:
+            self.stdout.write(name)
+        self.deleted += 1
+
+    def collect(self):
+        self.collect_images()
+        self.collect_thumbnails()
+        return self.deleted
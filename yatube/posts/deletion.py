@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.tasks import enqueue
+
+from .models import (ArchivedComment, ArchivedPost, Comment, DailyActivity,
+                     Deletion, Follow, Group, Post, TrendingBucket, User)
+
+
+def option(name):
+    defaults = {
+        'DELETION_BATCH_SIZE': 500,
+        'DELETION_BATCHES_PER_TASK': 20,
+    }
+    return getattr(settings, name, defaults[name])
+
+
+def delete_user(user):
+    '''
+    Удаление пользователя: сразу деактивируем (его страница и посты
+    пропадают из лент), а записи удаляем в фоне
+    '''
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        deletion = Deletion.objects.create(kind=Deletion.USER,
+                                           object_id=user.pk,
+                                           name=user.username)
+        enqueue(run_deletion, deletion.pk)
+    return deletion
+
+
+def delete_group(group):
+    '''
+    Удаление группы: сразу скрываем страницу, а посты отвязываем в фоне
+    '''
+    with transaction.atomic():
+        group.hidden = True
+        group.save(update_fields=['hidden'])
+        deletion = Deletion.objects.create(kind=Deletion.GROUP,
+                                           object_id=group.pk,
+                                           name=group.slug)
+        enqueue(run_deletion, deletion.pk)
+    return deletion
+
+
+def user_stages(user_id):
+    # Сначала комментарии к постам, иначе удаление пачки популярных
+    # постов снова потянет за собой каскад неограниченного размера
+    return (
+        ('follows', Follow.objects.filter(Q(user_id=user_id)
+                                          | Q(author_id=user_id)), None),
+        ('comments', Comment.objects.filter(author_id=user_id), None),
+        ('post_comments', Comment.objects.filter(post__author_id=user_id),
+         None),
+        ('posts', Post.objects.filter(author_id=user_id), None),
+        ('archived_comments',
+         ArchivedComment.objects.filter(Q(author_id=user_id)
+                                        | Q(post__author_id=user_id)), None),
+        ('archived_posts', ArchivedPost.objects.filter(author_id=user_id),
+         None),
+        ('activity', DailyActivity.objects.filter(kind=DailyActivity.AUTHOR,
+                                                  object_id=user_id), None),
+        ('user', User.objects.filter(pk=user_id), None),
+    )
+
+
+def group_stages(group_id):
+    return (
+        ('posts', Post.objects.filter(group_id=group_id), {'group': None}),
+        ('archived_posts', ArchivedPost.objects.filter(group_id=group_id),
+         {'group': None}),
+        ('trending', TrendingBucket.objects.filter(
+            kind=TrendingBucket.GROUP, object_id=group_id
+        ), None),
+        ('activity', DailyActivity.objects.filter(kind=DailyActivity.GROUP,
+                                                  object_id=group_id), None),
+        ('group', Group.objects.filter(pk=group_id), None),
+    )
+
+
+STAGES = {Deletion.USER: user_stages, Deletion.GROUP: group_stages}
+
+
+def process_batch(queryset, changes, batch_size):
+    '''
+    Одна пачка в своей транзакции: блокировка на запись держится
+    недолго, а сборщик каскада Django грузит не больше batch_size
+    объектов (плюс их собственные мелкие зависимости)
+    '''
+    pks = list(queryset.order_by('pk')
+               .values_list('pk', flat=True)[:batch_size])
+    if not pks:
+        return 0
+
+    batch = queryset.model.objects.filter(pk__in=pks)
+    with transaction.atomic():
+        if changes is None:
+            batch.delete()
+        else:
+            batch.update(**changes)
+    return len(pks)
+
+
+def run_deletion(deletion_pk):
+    '''
+    Задача очереди: обрабатывает не больше DELETION_BATCHES_PER_TASK
+    пачек и, если работа осталась, ставит себя в очередь снова,
+    чтобы не занимать воркер надолго. Этапы идемпотентны - после
+    падения удаление продолжится с оставшихся записей
+    '''
+    deletion = Deletion.objects.get(pk=deletion_pk)
+    if deletion.finished:
+        return
+
+    batch_size = option('DELETION_BATCH_SIZE')
+    batches = option('DELETION_BATCHES_PER_TASK')
+
+    for stage, queryset, changes in STAGES[deletion.kind](deletion.object_id):
+        while True:
+            if not batches:
+                enqueue(run_deletion, deletion_pk)
+                return
+
+            processed = process_batch(queryset, changes, batch_size)
+            if not processed:
+                break
+
+            batches -= 1
+            Deletion.objects.filter(pk=deletion_pk).update(
+                stage=stage, removed=F('removed') + processed
+            )
+
+    Deletion.objects.filter(pk=deletion_pk).update(stage='',
+                                                   finished=timezone.now())
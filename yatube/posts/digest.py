@@ -0,0 +1,144 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Max
+from django.template.loader import render_to_string
+
+from .models import DigestCursor, Follow, Post, User
+
+CURSOR_NAME = 'new_posts'
+LOCK_KEY = 'digest.lock'
+
+
+def get_cursor():
+    '''
+    При первом запуске рассылаем только то, что появится после него,
+    а не всю историю постов
+    '''
+    cursor, _ = DigestCursor.objects.get_or_create(
+        name=CURSOR_NAME,
+        defaults={'last_post_id': last_post_id()}
+    )
+    return cursor
+
+
+def last_post_id():
+    return Post.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def build_message(user, posts):
+    context = {'user': user,
+               'posts': posts,
+               'site_url': getattr(settings, 'SITE_URL', '')}
+    return EmailMessage(
+        subject=render_to_string('posts/email/digest_subject.txt',
+                                 context).strip(),
+        body=render_to_string('posts/email/digest.txt', context),
+        to=[user.email],
+    )
+
+
+def lock_timeout():
+    return getattr(settings, 'DIGEST_LOCK_TIMEOUT', 10 * 60)
+
+
+def send_digests(batch_size=100, stdout=None):
+    '''
+    Рассылка одного письма на подписчика со всеми новыми постами
+    его авторов
+
+    Посты, подписки и получатели выбираются несколькими запросами
+    на пачку получателей, все письма уходят через одно соединение.
+    Курсор сохраняется до отправки пачки, поэтому после падения
+    одно и то же письмо повторно не уйдёт. Одновременно идёт только
+    одна рассылка: блокировка в кеше, а не select_for_update, который
+    держится лишь до конца транзакции (а в SQLite не работает вовсе)
+
+    Возвращает количество отправленных писем
+    '''
+    if not cache.add(LOCK_KEY, 1, lock_timeout()):
+        if stdout is not None:
+            stdout.write('Рассылка уже идёт в другом процессе')
+        return 0
+
+    try:
+        return send_batches(batch_size, stdout)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def send_batches(batch_size, stdout):
+    with transaction.atomic():
+        cursor = DigestCursor.objects.select_for_update().get(
+            pk=get_cursor().pk
+        )
+        if cursor.pending_post_id is None:
+            cursor.pending_post_id = last_post_id()
+            cursor.last_user_id = 0
+            cursor.save()
+
+    posts_by_author = defaultdict(list)
+    posts = (Post.objects
+             .filter(pk__gt=cursor.last_post_id,
+                     pk__lte=cursor.pending_post_id)
+             .select_related('author', 'group')
+             .order_by('pk'))
+    for post in posts:
+        posts_by_author[post.author_id].append(post)
+
+    sent = 0
+    with get_connection() as connection:
+        while posts_by_author:
+            # Блокировка продлевается на каждую пачку: её время
+            # жизни - запас на одну пачку, а не на всю рассылку
+            cache.touch(LOCK_KEY, lock_timeout())
+
+            recipients = list(
+                Follow.objects
+                .filter(author_id__in=posts_by_author.keys(),
+                        user_id__gt=cursor.last_user_id)
+                .order_by('user_id')
+                .values_list('user_id', flat=True)
+                .distinct()[:batch_size]
+            )
+            if not recipients:
+                break
+
+            follows = defaultdict(list)
+            pairs = (
+                Follow.objects
+                .filter(user_id__in=recipients,
+                        author_id__in=posts_by_author.keys())
+                .values_list('user_id', 'author_id')
+            )
+            for user_id, author_id in pairs:
+                follows[user_id].append(author_id)
+
+            messages = []
+            users = User.objects.filter(pk__in=recipients).exclude(email='')
+            for user in users:
+                user_posts = sorted(
+                    (post for author_id in follows[user.pk]
+                     for post in posts_by_author[author_id]),
+                    key=lambda post: post.pk
+                )
+                messages.append(build_message(user, user_posts))
+
+            cursor.last_user_id = recipients[-1]
+            cursor.save(update_fields=['last_user_id'])
+
+            if messages:
+                sent += connection.send_messages(messages) or 0
+
+            if stdout is not None:
+                stdout.write(f'Отправлено писем: {sent}')
+
+    cursor.last_post_id = cursor.pending_post_id
+    cursor.pending_post_id = None
+    cursor.last_user_id = 0
+    cursor.save()
+
+    return sent
@@ -0,0 +1,238 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.db.models import Max
+from django.http import Http404
+from django.test import RequestFactory
+from django.urls import NoReverseMatch, resolve, reverse
+
+from core.templatetags.stale_cache import bypass_fragment_cache
+
+from .models import ArchivedPost, ExportChange, Group, Post, User
+from .views import POSTS_PER_PAGE
+
+# Страница N ленты сохраняется рядом с первой как index-N.html,
+# прокси отдаёт её на ?page=N, например для nginx:
+# try_files $uri/index-$arg_page.html $uri/index.html =404;
+PAGE_TEMPLATE = 'index-%s.html'
+
+
+def option(name):
+    defaults = {
+        'STATIC_EXPORT_ROOT': os.path.join(settings.BASE_DIR, 'export'),
+        'STATIC_EXPORT_WORKERS': None,
+    }
+    return getattr(settings, name, defaults[name])
+
+
+def record(*pages):
+    '''
+    record(('posts:profile', username), ...) - страницы в журнал
+    '''
+    changes = []
+    for name, *args in pages:
+        try:
+            changes.append(ExportChange(path=reverse(name, args=args)))
+        except NoReverseMatch:
+            # Без адреса (например, пустой slug) страницы и нет
+            continue
+    ExportChange.objects.bulk_create(changes)
+
+
+def on_post_changed(sender, instance, **kwargs):
+    pages = [('posts:index',),
+             ('posts:post_detail', instance.pk),
+             ('posts:profile', instance.author.username)]
+    if instance.group_id:
+        pages.append(('posts:group_list', instance.group.slug))
+    record(*pages)
+
+
+def on_comment_changed(sender, instance, **kwargs):
+    record(('posts:post_detail', instance.post_id))
+
+
+def on_group_changed(sender, instance, **kwargs):
+    record(('posts:group_list', instance.slug))
+
+
+def on_user_changed(sender, instance, update_fields=None, **kwargs):
+    # Вход на сайт сохраняет last_login - на страницах его нет
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    record(('posts:profile', instance.username))
+
+
+# Сколько постов в ленте, чтобы знать число её страниц
+LISTINGS = {
+    'index': lambda: Post.objects.visible().count(),
+    'group_list': lambda slug: (Post.objects
+                                .filter(group__slug=slug, group__hidden=False)
+                                .visible()
+                                .count()),
+    'profile': lambda username: sum(
+        model.objects.filter(author__username=username,
+                             author__is_active=True).count()
+        for model in (Post, ArchivedPost)
+    ),
+}
+
+
+def all_paths():
+    '''
+    Все публичные страницы сайта для полной выгрузки
+    '''
+    yield reverse('posts:index')
+    groups = Group.objects.filter(hidden=False).exclude(slug='')
+    for slug in groups.values_list('slug', flat=True):
+        yield reverse('posts:group_list', args=[slug])
+    users = User.objects.filter(is_active=True).exclude(username='')
+    for username in users.values_list('username', flat=True):
+        yield reverse('posts:profile', args=[username])
+    for model in (Post, ArchivedPost):
+        for pk in model.objects.visible().values_list('pk', flat=True):
+            yield reverse('posts:post_detail', args=[pk])
+
+
+def page_count(path):
+    match = resolve(path)
+    count = LISTINGS[match.url_name](*match.args, **match.kwargs)
+    return max(ceil(count / POSTS_PER_PAGE), 1)
+
+
+def expand(paths):
+    '''
+    Адреса -> (адрес, число страниц): у лент перерисовываются все
+    страницы, потому что новый пост сдвигает каждую из них.
+    У остальных страниц число None
+    '''
+    for path in paths:
+        if resolve(path).url_name in LISTINGS:
+            yield path, page_count(path)
+        else:
+            yield path, None
+
+
+def file_name(root, path, page=None):
+    directory = os.path.join(root, path.strip('/'))
+    if page and page > 1:
+        return os.path.join(directory, PAGE_TEMPLATE % page)
+    return os.path.join(directory, 'index.html')
+
+
+def render(path, page=None):
+    '''
+    Страница глазами анонима, без middleware (ограничение частоты
+    и сброс нагрузки тут ни к чему). None - страницы больше нет
+    '''
+    request = RequestFactory().get(path, {'page': page} if page else {})
+    request.user = AnonymousUser()
+    match = resolve(path)
+    try:
+        # Фрагмент в кеше может быть старше изменения, ради которого
+        # страницу перерисовываем, а журнал после выгрузки очищается
+        with bypass_fragment_cache():
+            response = match.func(request, *match.args, **match.kwargs)
+    except Http404:
+        return None
+    if response.status_code != 200:
+        return None
+    return response.content
+
+
+def export_page(root, path, page=None):
+    '''
+    Перерисовка одной страницы: файл подменяется целиком, поэтому
+    файловый сервер никогда не отдаёт недописанную страницу
+    '''
+    name = file_name(root, path, page)
+    content = render(path, page)
+
+    if content is None:
+        if os.path.exists(name):
+            os.remove(name)
+        return False
+
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    temporary = f'{name}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(content)
+    os.replace(temporary, name)
+    return True
+
+
+def remove_extra_pages(root, path, pages):
+    '''
+    Лента стала короче - её лишние страницы удаляем
+    '''
+    keep = {file_name(root, path, page) for page in range(2, pages + 1)}
+    pattern = os.path.join(os.path.dirname(file_name(root, path)),
+                           PAGE_TEMPLATE % '*')
+    removed = 0
+    for name in glob.glob(pattern):
+        if name not in keep:
+            os.remove(name)
+            removed += 1
+    return removed
+
+
+def init_worker():
+    django.setup()
+    # Соединения родителя после fork не годятся, каждый процесс
+    # открывает своё
+    connections.close_all()
+
+
+def export_task(task):
+    return export_page(*task)
+
+
+def export_site(root=None, full=False, workers=None):
+    '''
+    Выгрузка публичных страниц в HTML: при full - всех, иначе только
+    изменённых с прошлой выгрузки по журналу ExportChange. Страницы
+    рисуются пулом процессов, workers=1 - в текущем процессе.
+    Возвращает (записано страниц, удалено страниц)
+    '''
+    root = root or option('STATIC_EXPORT_ROOT')
+    workers = workers or option('STATIC_EXPORT_WORKERS') or os.cpu_count()
+    # Без главной выгрузки ещё не было - делаем полную
+    full = full or not os.path.exists(file_name(root, '/'))
+
+    # Изменения, появившиеся во время выгрузки, останутся до следующей
+    last_change = ExportChange.objects.aggregate(last=Max('pk'))['last'] or 0
+    if full:
+        paths = all_paths()
+    else:
+        paths = set(ExportChange.objects.filter(pk__lte=last_change)
+                                        .values_list('path', flat=True))
+
+    tasks = []
+    removed = 0
+    for path, pages in expand(paths):
+        if pages is None:
+            tasks.append((root, path, None))
+        else:
+            tasks.extend((root, path, page) for page in range(1, pages + 1))
+            removed += remove_extra_pages(root, path, pages)
+
+    if workers > 1 and len(tasks) > 1:
+        connections.close_all()
+        chunksize = max(len(tasks) // (workers * 4), 1)
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker) as executor:
+            results = list(executor.map(export_task, tasks,
+                                        chunksize=chunksize))
+    else:
+        results = [export_task(task) for task in tasks]
+
+    ExportChange.objects.filter(pk__lte=last_change).delete()
+
+    written = sum(results)
+    return written, removed + len(results) - written
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Follow
+
+KEY_TEMPLATE = 'follows.authors.%s'
+
+
+class FollowedAuthors(frozenset):
+    '''
+    id авторов, на которых подписан пользователь: проверка
+    post.author_id in followed в карточке - без запроса к базе
+    '''
+    def __str__(self):
+        # Стабильное представление для ключа {% stale_cache %}
+        return ','.join(map(str, sorted(self)))
+
+
+def get_followed_authors(user):
+    '''
+    Подписки пользователя одним запросом на всю страницу, а дальше
+    из кеша, пока он не подпишется или не отпишется
+    '''
+    if not user.is_authenticated:
+        return FollowedAuthors()
+
+    key = KEY_TEMPLATE % user.pk
+    author_ids = cache.get(key)
+
+    if author_ids is None:
+        author_ids = sorted(Follow.objects.filter(user=user)
+                                          .values_list('author_id',
+                                                       flat=True))
+        cache.set(key, author_ids,
+                  getattr(settings, 'FOLLOWED_AUTHORS_CACHE_TIMEOUT', 3600))
+
+    return FollowedAuthors(author_ids)
+
+
+def get_buttons_state(user, followed, page_obj):
+    '''
+    Ключ {% stale_cache %} для карточек с кнопками подписки: от
+    пользователя зависят только кнопки авторов этой страницы. Кто не
+    подписан ни на кого из них и не писал здесь сам, видит те же
+    карточки, что и остальные такие же, - фрагмент у них общий
+    '''
+    if not user.is_authenticated:
+        return 'anonymous'
+
+    authors = set(page_obj.object_list.values_list('author_id', flat=True))
+    own = user.pk if user.pk in authors else ''
+    return f'{FollowedAuthors(authors & followed)}|{own}'
+
+
+def invalidate_followed_authors(sender, instance, **kwargs):
+    cache.delete(KEY_TEMPLATE % instance.user_id)
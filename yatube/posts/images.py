@@ -0,0 +1,60 @@
+import base64
+from io import BytesIO
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+# Пропорции как у миниатюры в карточке (960x339), растягивается
+# браузером с размытием - детали не нужны
+PLACEHOLDER_SIZE = (20, 7)
+
+
+def make_placeholder(file):
+    '''
+    Крошечное превью картинки для вставки прямо в HTML:
+    'data:image/png;base64,...'
+
+    Если файл не читается как картинка - ''
+    '''
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            preview = ImageOps.fit(image.convert('RGB'), PLACEHOLDER_SIZE,
+                                   Image.BILINEAR)
+        file.seek(0)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        return ''
+
+    buffer = BytesIO()
+    preview.save(buffer, 'PNG', optimize=True)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+
+    return f'data:image/png;base64,{encoded}'
+
+
+def release_image(storage, name):
+    '''
+    Пост больше не ссылается на картинку: после фиксации транзакции
+    уменьшаем счётчик ссылок, а с последней ссылкой удаляются файл
+    и его миниатюры
+    '''
+    if not name:
+        return
+
+    def release():
+        try:
+            storage.delete(name)
+        except SuspiciousFileOperation:
+            # Путь вне MEDIA_ROOT - не наш файл, удалять его не нам
+            return
+        if not storage.exists(name):
+            delete_thumbnails(ImageFile(name, storage), delete_file=False)
+
+    transaction.on_commit(release)
+
+
+def on_post_deleted(sender, instance, **kwargs):
+    release_image(instance.image.storage, instance.image.name)
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+from core.lru import LRUCache
+
+from .models import Group, User
+
+GENERATION_KEY_TEMPLATE = 'lookups.generation.%s'
+
+
+def make_cache():
+    return LRUCache(
+        maxsize=getattr(settings, 'LOOKUP_CACHE_SIZE', 1024),
+        ttl=getattr(settings, 'LOOKUP_CACHE_TTL', 60),
+        negative_ttl=getattr(settings, 'LOOKUP_CACHE_NEGATIVE_TTL', 10),
+    )
+
+
+users = make_cache()
+groups = make_cache()
+
+# Поколение общего кеша, с которым заполнялся кеш процесса
+generations = {}
+
+
+def check_generation(name, lookup_cache):
+    '''
+    Кеш процесса не слышит сигналов из других воркеров, поэтому
+    изменения отмечаются поколением в общем кеше: сдвинулось -
+    кеш процесса очищается целиком
+    '''
+    key = GENERATION_KEY_TEMPLATE % name
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 0, None)
+        generation = cache.get(key, 0)
+
+    if generations.get(name) != generation:
+        lookup_cache.clear()
+        generations[name] = generation
+
+
+def bump_generation(name):
+    '''
+    Сдвиг поколения: кеши всех процессов очистятся при следующем поиске
+    '''
+    key = GENERATION_KEY_TEMPLATE % name
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def get_user_or_404(username):
+    '''
+    get_object_or_404(User, username=username) через кеш процесса
+    '''
+    check_generation('users', users)
+    user = users.get_or_load(
+        username, lambda: User.objects.filter(username=username).first()
+    )
+    if user is None or not user.is_active:
+        raise Http404
+    return user
+
+
+def get_group_or_404(slug):
+    '''
+    get_object_or_404(Group, slug=slug) через кеш процесса
+    '''
+    check_generation('groups', groups)
+    group = groups.get_or_load(
+        slug, lambda: Group.objects.filter(slug=slug).first()
+    )
+    if group is None or group.hidden:
+        raise Http404
+    return group
+
+
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    # Вход на сайт сохраняет last_login - ни адрес, ни видимость
+    # страницы от этого не меняются
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    users.invalidate(instance.username)
+    users.invalidate_where(lambda user: user.pk == instance.pk)
+    # После коммита, иначе другой воркер успеет закешировать
+    # ещё не изменённую запись
+    transaction.on_commit(lambda: bump_generation('users'))
+
+
+def invalidate_group(sender, instance, **kwargs):
+    groups.invalidate(instance.slug)
+    groups.invalidate_where(lambda group: group.pk == instance.pk)
+    transaction.on_commit(lambda: bump_generation('groups'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts.archive import archive_posts
+
+
+class Command(BaseCommand):
+    help = ('Перенос старых постов с комментариями в архивные таблицы, '
+            'чтобы таблица постов и её индексы не росли бесконечно')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Архивировать посты старше N дней '
+                                 '(по умолчанию POST_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Сколько постов переносить за транзакцию')
+
+    def handle(self, *args, **options):
+        archived = archive_posts(days=options['days'],
+                                 batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив постов: '
+                                             f'{archived}'))
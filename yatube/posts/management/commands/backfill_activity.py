@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.activity import backfill
+
+
+class Command(BaseCommand):
+    help = 'Пересборка дневных сводок активности авторов и групп'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Пересобрать только последние N дней')
+
+    def handle(self, *args, **options):
+        count = backfill(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Записано строк: {count}'))
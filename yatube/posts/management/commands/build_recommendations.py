@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт рекомендаций "на кого подписаться" по графу подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=5,
+                            help='Сколько авторов рекомендовать')
+
+    def handle(self, *args, **options):
+        count = build_recommendations(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации построены для пользователей: {count}'
+        ))
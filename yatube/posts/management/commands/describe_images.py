@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts.images import make_placeholder
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Превью для картинок постов, загруженных '
+            'до появления этого поля')
+
+    def handle(self, *args, **options):
+        posts = (Post.objects.exclude(image='')
+                             .filter(image_placeholder='')
+                             .only('pk', 'image'))
+        described = 0
+
+        for post in posts.iterator():
+            try:
+                post.image.open('rb')
+            except OSError:
+                self.stderr.write(f'Нет файла {post.image.name}')
+                continue
+
+            with post.image:
+                placeholder = make_placeholder(post.image)
+
+            if placeholder:
+                Post.objects.filter(pk=post.pk).update(
+                    image_placeholder=placeholder
+                )
+                described += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано картинок: '
+                                             f'{described}'))
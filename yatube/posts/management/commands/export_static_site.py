@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.export import export_site
+
+
+class Command(BaseCommand):
+    help = ('Выгрузка публичных страниц в HTML-файлы для отдачи '
+            'файловым сервером или CDN. Перерисовываются только '
+            'страницы, изменённые с прошлой выгрузки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='Каталог выгрузки '
+                                 '(по умолчанию STATIC_EXPORT_ROOT)')
+        parser.add_argument('--full', action='store_true',
+                            help='Перерисовать все страницы')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Число процессов, 1 - без пула')
+
+    def handle(self, *args, **options):
+        written, removed = export_site(root=options['output'],
+                                       full=options['full'],
+                                       workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано страниц: {written}, удалено: {removed}'
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts.cleanup import Collector
+
+
+class Command(BaseCommand):
+    help = ('Удаление картинок, на которые не ссылается ни один пост, '
+            'и потерянных миниатюр')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только вывести, что будет удалено')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Сколько файлов проверять одним запросом')
+        parser.add_argument('--min-age', type=int, default=60 * 60,
+                            help='Не трогать файлы моложе N секунд')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='Удалять не больше N файлов в секунду')
+
+    def handle(self, *args, **options):
+        collector = Collector(batch_size=options['batch_size'],
+                              min_age=options['min_age'],
+                              rate=options['rate'],
+                              dry_run=options['dry_run'],
+                              stdout=self.stdout)
+        deleted = collector.collect()
+
+        verb = 'К удалению' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{verb} файлов: {deleted}'))
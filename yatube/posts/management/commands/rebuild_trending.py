@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import TrendingBucket
+from posts.trending import rebuild_top
+
+
+class Command(BaseCommand):
+    help = 'Восстановление топа популярного по часовым счетчикам'
+
+    def handle(self, *args, **options):
+        for kind, name in TrendingBucket.KINDS:
+            top = rebuild_top(kind)
+            self.stdout.write(f'{name}: {len(top["items"])}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.digest import send_digests
+
+
+class Command(BaseCommand):
+    help = 'Рассылка подписчикам дайджеста новых постов их авторов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Сколько писем отправлять за одно '
+                                 'соединение')
+
+    def handle(self, *args, **options):
+        sent = send_digests(batch_size=options['batch_size'],
+                            stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Готово, писем: {sent}'))
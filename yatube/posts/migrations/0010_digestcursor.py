@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_auto_20221202_2056'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_post_id', models.PositiveIntegerField(default=0)),
+                ('pending_post_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_user_id', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
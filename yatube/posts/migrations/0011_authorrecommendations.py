@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_digestcursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorRecommendations',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('authors', models.TextField(default='[]')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='author_recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_image_preview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Deletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Пользователь'), ('group', 'Группа')], max_length=5, verbose_name='Что удаляем')),
+                ('object_id', models.PositiveIntegerField(verbose_name='id объекта')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('stage', models.CharField(blank=True, max_length=50, verbose_name='Этап')),
+                ('removed', models.PositiveIntegerField(default=0, verbose_name='Обработано записей')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Начато')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='hidden',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Скрыта'),
+        ),
+    ]
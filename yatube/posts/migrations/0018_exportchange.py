@@ -0,0 +1,21 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, verbose_name='Адрес страницы')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Изменена')),
+            ],
+        ),
+    ]
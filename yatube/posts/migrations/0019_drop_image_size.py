@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-19 20:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_exportchange'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='archivedpost',
+            name='image_height',
+        ),
+        migrations.RemoveField(
+            model_name='archivedpost',
+            name='image_width',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='image_height',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='image_width',
+        ),
+    ]
@@ -1,6 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import ContentAddressedStorage
+
+from .images import make_placeholder, release_image
+from .querysets import PostQuerySet
+
 User = get_user_model()
 
 
@@ -13,6 +18,9 @@ class Group(models.Model):
     slug = models.SlugField(unique=True, verbose_name='Имя группы для ссылки')
     description = models.TextField(verbose_name='Описание группы')
 
+    # Группа удаляется в фоне (posts.deletion), страница уже недоступна
+    hidden = models.BooleanField('Скрыта', default=False, editable=False)
+
     def __str__(self):
         return self.title
 
@@ -43,11 +51,41 @@ class Post(models.Model):
 
     image = models.ImageField('Картинка',
                               upload_to='posts/',
+                              storage=ContentAddressedStorage(),
                               blank=True)
 
+    # Заполняется при загрузке картинки, см. save()
+    image_placeholder = models.TextField('Превью картинки',
+                                         blank=True,
+                                         editable=False)
+
+    objects = PostQuerySet.as_manager()
+
     def __str__(self):
         return self.text[:15]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        # Запоминаем картинку из базы, чтобы при сохранении
+        # не пересчитывать превью, если она не менялась
+        post._loaded_image = post.__dict__.get('image')
+        return post
+
+    def save(self, *args, **kwargs):
+        if not self.image:
+            self.image_placeholder = ''
+        elif self.image.name != getattr(self, '_loaded_image', None):
+            self.image_placeholder = make_placeholder(self.image)
+
+        super().save(*args, **kwargs)
+
+        # Картинку заменили или убрали - старая больше не нужна
+        previous = getattr(self, '_loaded_image', None)
+        if previous and previous != self.image.name:
+            release_image(self.image.storage, previous)
+        self._loaded_image = self.image.name
+
     class Meta:
         ordering = ['-pub_date']
 
@@ -77,7 +115,194 @@ class Follow(models.Model):
                                related_name='following',
                                on_delete=models.CASCADE)
 
+    created = models.DateTimeField('Дата подписки', auto_now_add=True)
+
     class Meta:
         ordering = ['-author']
         constraints = [models.UniqueConstraint(fields=['user', 'author'],
                                                name='unique_follow')]
+
+
+class DigestCursor(models.Model):
+    '''
+    Позиция рассылки дайджестов новых постов подписчикам
+
+    Посты с id <= last_post_id уже разосланы. Во время рассылки
+    pending_post_id фиксирует верхнюю границу текущего прохода,
+    а last_user_id - последнего получателя, которому письмо ушло,
+    чтобы прерванная рассылка продолжилась с того же места
+    '''
+    name = models.CharField(max_length=50, unique=True)
+    last_post_id = models.PositiveIntegerField(default=0)
+    pending_post_id = models.PositiveIntegerField(null=True, blank=True)
+    last_user_id = models.PositiveIntegerField(default=0)
+
+
+class AuthorRecommendations(models.Model):
+    '''
+    Рекомендации "на кого подписаться", посчитанные командой
+    build_recommendations. Авторы хранятся готовым JSON-списком,
+    чтобы страница получала их одним запросом без JOIN
+    '''
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                related_name='author_recommendations')
+    authors = models.TextField(default='[]')
+    updated = models.DateTimeField(auto_now=True)
+
+
+class TrendingBucket(models.Model):
+    '''
+    Счетчики активности поста или группы за один час
+
+    Пополняются по событиям (новый пост, новый комментарий),
+    из них считаются скорость за скользящие окна на вкладке
+    "Популярное" и восстанавливается рейтинг, если кеш потерян
+    '''
+    POST = 'post'
+    GROUP = 'group'
+    KINDS = ((POST, 'Пост'), (GROUP, 'Группа'))
+
+    kind = models.CharField(max_length=5, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    bucket = models.PositiveIntegerField('Номер часа')
+    posts = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['kind', 'object_id', 'bucket'],
+            name='unique_trending_bucket'
+        )]
+        indexes = [models.Index(fields=['kind', 'bucket'],
+                                name='trending_kind_bucket')]
+
+
+class DailyActivity(models.Model):
+    '''
+    Дневная сводка активности автора или группы
+
+    Поддерживается сигналами при создании и удалении постов,
+    комментариев и подписок, пересобирается командой backfill_activity.
+    Графики на страницах профиля и группы строятся только по ней
+    '''
+    AUTHOR = 'author'
+    GROUP = 'group'
+    KINDS = ((AUTHOR, 'Автор'), (GROUP, 'Группа'))
+
+    kind = models.CharField(max_length=6, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    day = models.DateField()
+    posts = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    followers = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        constraints = [models.UniqueConstraint(
+            fields=['kind', 'object_id', 'day'],
+            name='unique_daily_activity'
+        )]
+
+
+class Deletion(models.Model):
+    '''
+    Фоновое удаление пользователя или группы (posts.deletion)
+
+    Объект сразу скрывается, а зависимые записи удаляются
+    небольшими пачками. stage и removed показывают, докуда дошли
+    '''
+    USER = 'user'
+    GROUP = 'group'
+    KINDS = ((USER, 'Пользователь'), (GROUP, 'Группа'))
+
+    kind = models.CharField('Что удаляем', max_length=5, choices=KINDS)
+    object_id = models.PositiveIntegerField('id объекта')
+    name = models.CharField('Название', max_length=200)
+    stage = models.CharField('Этап', max_length=50, blank=True)
+    removed = models.PositiveIntegerField('Обработано записей', default=0)
+    created = models.DateTimeField('Начато', auto_now_add=True)
+    finished = models.DateTimeField('Завершено', null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.name}'
+
+
+class ArchivedPost(models.Model):
+    '''
+    Посты старше POST_ARCHIVE_AFTER_DAYS, перенесённые из Post
+    командой archive_posts (posts.archive)
+
+    id тот же, что был у поста, поэтому ссылки на пост продолжают
+    работать. Ленты архив не читают, таблица Post и её индексы
+    остаются маленькими. Архивные посты только для чтения
+    '''
+    id = models.PositiveIntegerField(primary_key=True)
+
+    text = models.TextField('Текст поста')
+
+    pub_date = models.DateTimeField('Дата публикации')
+
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='archived_posts',
+                               verbose_name='Автор')
+
+    group = models.ForeignKey(Group,
+                              blank=True,
+                              null=True,
+                              on_delete=models.SET_NULL,
+                              related_name='archived_posts',
+                              verbose_name='Группа')
+
+    image = models.ImageField('Картинка',
+                              upload_to='posts/',
+                              storage=ContentAddressedStorage(),
+                              blank=True)
+
+    image_placeholder = models.TextField('Превью картинки', blank=True)
+
+    archived = models.DateTimeField('Перенесён в архив', auto_now_add=True)
+
+    objects = PostQuerySet.as_manager()
+
+    def __str__(self):
+        return self.text[:15]
+
+    class Meta:
+        ordering = ['-pub_date']
+
+
+class ArchivedComment(models.Model):
+    '''
+    Комментарии к архивным постам, переносятся вместе с постом
+    '''
+    id = models.PositiveIntegerField(primary_key=True)
+
+    post = models.ForeignKey(ArchivedPost,
+                             on_delete=models.CASCADE,
+                             related_name='comments')
+
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='archived_comments')
+
+    text = models.TextField('Текст')
+
+    created = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-created']
+
+
+class ExportChange(models.Model):
+    '''
+    Журнал изменённых страниц для export_static_site (posts.export):
+    путь страницы, которую нужно перерисовать при следующей выгрузке.
+    Записи удаляются, когда выгрузка их обработала
+    '''
+    path = models.CharField('Адрес страницы', max_length=255)
+    created = models.DateTimeField('Изменена', auto_now_add=True)
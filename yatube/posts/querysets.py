@@ -0,0 +1,102 @@
+from django.db import models
+from django.db.models.query import ValuesListIterable
+
+# Только то, что выводят карточки постов в лентах
+FEED_FIELDS = (
+    'id', 'text', 'pub_date', 'image', 'image_placeholder', 'author_id',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__title', 'group__slug',
+)
+
+
+class FeedAuthor:
+    __slots__ = ('username', 'first_name', 'last_name')
+
+    def __init__(self, username, first_name, last_name):
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+    def get_full_name(self):
+        return f'{self.first_name} {self.last_name}'.strip()
+
+    def __str__(self):
+        return self.username
+
+
+class FeedGroup:
+    __slots__ = ('title', 'slug')
+
+    def __init__(self, title, slug):
+        self.title = title
+        self.slug = slug
+
+    def __str__(self):
+        return self.title
+
+
+class FeedPost:
+    '''
+    Строка ленты: те же атрибуты, что шаблоны карточек берут у Post,
+    но без экземпляра модели. image - имя файла, его понимает
+    {% thumbnail %}
+    '''
+    __slots__ = ('pk', 'text', 'pub_date', 'image', 'image_placeholder',
+                 'author_id', 'author', 'group')
+
+    def __init__(self, pk, text, pub_date, image, image_placeholder,
+                 author_id, author, group):
+        self.pk = pk
+        self.text = text
+        self.pub_date = pub_date
+        self.image = image
+        self.image_placeholder = image_placeholder
+        self.author_id = author_id
+        self.author = author
+        self.group = group
+
+    @property
+    def id(self):
+        return self.pk
+
+    def __str__(self):
+        return self.text[:15]
+
+
+class FeedRowIterable(ValuesListIterable):
+    def __iter__(self):
+        for (pk, text, pub_date, image, image_placeholder, author_id,
+             username, first_name, last_name, group_title,
+             group_slug) in super().__iter__():
+            group = (FeedGroup(group_title, group_slug)
+                     if group_slug is not None else None)
+            yield FeedPost(pk, text, pub_date, image, image_placeholder,
+                           author_id,
+                           FeedAuthor(username, first_name, last_name),
+                           group)
+
+
+class PostQuerySet(models.QuerySet):
+    def visible(self):
+        '''
+        Без постов пользователей, которые удаляются в фоне
+        (posts.deletion) или отключены
+        '''
+        return self.filter(author__is_active=True)
+
+    def for_feed(self, rows=False):
+        '''
+        Посты для лент одним запросом с JOIN, но только с колонками
+        карточек: без хеша пароля и прочих полей автора и без
+        описания группы
+
+        rows=True - вместо экземпляров Post лёгкие объекты FeedPost,
+        паджинатор с таким QuerySet работает как обычно
+        '''
+        if not rows:
+            return (self.select_related('author', 'group')
+                        .only('author', 'group', *FEED_FIELDS))
+
+        queryset = self.values_list(*FEED_FIELDS)
+        queryset._iterable_class = FeedRowIterable
+        return queryset
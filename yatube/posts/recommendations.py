@@ -0,0 +1,129 @@
+import json
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .models import AuthorRecommendations, Follow, User
+
+# Вес рекомендаций по "авторам, которых читают вместе с вашими"
+# относительно "подписок ваших подписок"
+CO_FOLLOW_WEIGHT = 0.5
+
+
+def follow_matrix():
+    '''
+    Граф подписок одним запросом: разреженная матрица A, где
+    A[i, j] = 1, если пользователь ids[i] подписан на ids[j]
+    '''
+    pairs = np.array(Follow.objects.values_list('user_id', 'author_id'),
+                     dtype=np.int64).reshape(-1, 2)
+
+    ids, indices = np.unique(pairs, return_inverse=True)
+    indices = indices.reshape(-1, 2)
+    size = len(ids)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32),
+         (indices[:, 0], indices[:, 1])),
+        shape=(size, size)
+    )
+    return ids, matrix
+
+
+def score_matrix(follows):
+    '''
+    Оценки кандидатов для всех пользователей сразу:
+
+    follows @ follows - на кого подписаны те, на кого подписан я
+    follows @ (follows.T @ follows) - кого читают вместе с моими авторами
+
+    Уже отслеживаемые авторы и сам пользователь исключаются
+    '''
+    friends_of_friends = follows @ follows
+    co_followed = follows.T @ follows
+    co_followed.setdiag(0)
+
+    scores = friends_of_friends + CO_FOLLOW_WEIGHT * (follows @ co_followed)
+    scores = scores - scores.multiply(follows > 0)
+    scores.setdiag(0)
+    scores.eliminate_zeros()
+
+    return scores.tocoo()
+
+
+def top_k(scores, limit):
+    '''
+    Лучшие limit кандидатов в каждой строке без цикла по строкам:
+    сортируем все ненулевые оценки по (строка, -оценка) и берём
+    первые limit элементов каждой строки
+    '''
+    order = np.lexsort((-scores.data, scores.row))
+    rows = scores.row[order]
+    cols = scores.col[order]
+    data = scores.data[order]
+
+    row_starts = np.r_[0, np.flatnonzero(np.diff(rows)) + 1]
+    row_lengths = np.diff(np.r_[row_starts, len(rows)])
+    rank = np.arange(len(rows)) - np.repeat(row_starts, row_lengths)
+
+    keep = rank < limit
+    return rows[keep], cols[keep], data[keep]
+
+
+def build_recommendations(limit=5, batch_size=500):
+    '''
+    Пересчёт рекомендаций по всему графу подписок
+
+    Возвращает количество пользователей, для которых есть рекомендации
+    '''
+    ids, follows = follow_matrix()
+    if not len(ids):
+        AuthorRecommendations.objects.all().delete()
+        return 0
+
+    rows, cols, data = top_k(score_matrix(follows), limit)
+
+    candidate_ids = np.unique(ids[cols]).tolist()
+    authors = {
+        user['pk']: user for user in
+        User.objects.filter(pk__in=candidate_ids)
+                    .values('pk', 'username', 'first_name', 'last_name')
+    }
+
+    recommendations = {}
+    for row, col, score in zip(ids[rows].tolist(), ids[cols].tolist(),
+                               data.tolist()):
+        author = authors[col]
+        recommendations.setdefault(row, []).append({
+            'username': author['username'],
+            'full_name': f'{author["first_name"]} '
+                         f'{author["last_name"]}'.strip(),
+            'score': round(score, 2),
+        })
+
+    objects = [AuthorRecommendations(user_id=user_id,
+                                     authors=json.dumps(authors_list))
+               for user_id, authors_list in recommendations.items()]
+
+    with transaction.atomic():
+        AuthorRecommendations.objects.all().delete()
+        AuthorRecommendations.objects.bulk_create(objects,
+                                                  batch_size=batch_size)
+
+    return len(objects)
+
+
+def get_recommendations(user):
+    '''
+    Рекомендации для страницы - один запрос по первичному ключу
+    '''
+    if not user.is_authenticated:
+        return []
+
+    authors = (AuthorRecommendations.objects
+               .filter(user=user)
+               .values_list('authors', flat=True)
+               .first())
+
+    return json.loads(authors) if authors else []
@@ -0,0 +1,216 @@
+import heapq
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+
+from .models import ArchivedPost, Group, Post, User
+
+KEY_TEMPLATE = 'sitemap.%s.%s.%s'
+GENERATION_KEY_TEMPLATE = 'sitemap.generation.%s.%s'
+
+URLSET_START = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<urlset xmlns="http://www.sitemaps.org/schemas/'
+                'sitemap/0.9">\n')
+URLSET_END = '</urlset>\n'
+
+
+def option(name):
+    defaults = {
+        'SITEMAP_SHARD_SIZE': 50000,
+        'SITEMAP_CHUNK_SIZE': 2000,
+        'SITEMAP_CACHE_TIMEOUT': 24 * 60 * 60,
+    }
+    return getattr(settings, name, defaults[name])
+
+
+def keyset(queryset, start, stop):
+    '''
+    Строки с pk из [start, stop) по возрастанию pk пачками
+    по SITEMAP_CHUNK_SIZE: каждая пачка - WHERE pk > последний
+    из предыдущей, без OFFSET. Первое поле queryset - pk
+    '''
+    chunk_size = option('SITEMAP_CHUNK_SIZE')
+    last = start - 1
+    while True:
+        rows = list(queryset.filter(pk__gt=last, pk__lt=stop)
+                            .order_by('pk')[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+def latest_post(field):
+    '''
+    Дата последнего поста автора или группы (и в архиве тоже)
+    '''
+    return Coalesce(*(
+        Subquery(model.objects.filter(**{field: OuterRef('pk')})
+                              .order_by('-pub_date')
+                              .values('pub_date')[:1])
+        for model in (Post, ArchivedPost)
+    ))
+
+
+def post_rows(start, stop):
+    # Архивные посты сохраняют id, поэтому диапазон общий
+    # с основной таблицей и две выборки просто сливаются
+    for pk, pub_date in heapq.merge(*(
+        keyset(model.objects.visible().values_list('pk', 'pub_date'),
+               start, stop)
+        for model in (Post, ArchivedPost)
+    )):
+        yield reverse('posts:post_detail', args=[pk]), pub_date
+
+
+def profile_rows(start, stop):
+    users = (User.objects.filter(is_active=True)
+                         .exclude(username='')
+                         .annotate(lastmod=latest_post('author'))
+                         .values_list('pk', 'username', 'lastmod'))
+    for _, username, lastmod in keyset(users, start, stop):
+        yield reverse('posts:profile', args=[username]), lastmod
+
+
+def group_rows(start, stop):
+    groups = (Group.objects.filter(hidden=False)
+                           .exclude(slug='')
+                           .annotate(lastmod=latest_post('group'))
+                           .values_list('pk', 'slug', 'lastmod'))
+    for _, slug, lastmod in keyset(groups, start, stop):
+        yield reverse('posts:group_list', args=[slug]), lastmod
+
+
+def last_pk(*models):
+    return max(model.objects.aggregate(last=Max('pk'))['last'] or 0
+               for model in models)
+
+
+# Раздел: (строки шарда, наибольший pk). Шард N - объекты с pk
+# из [N * SITEMAP_SHARD_SIZE, (N + 1) * SITEMAP_SHARD_SIZE), больше
+# 50 000 адресов в нём не бывает, а границы не требуют OFFSET
+SECTIONS = {
+    'posts': (post_rows, lambda: last_pk(Post, ArchivedPost)),
+    'profiles': (profile_rows, lambda: last_pk(User)),
+    'groups': (group_rows, lambda: last_pk(Group)),
+}
+
+
+def shard_count(section):
+    _, last = SECTIONS[section]
+    return last() // option('SITEMAP_SHARD_SIZE') + 1
+
+
+def shard_of(pk):
+    return pk // option('SITEMAP_SHARD_SIZE')
+
+
+def generation_key(section, shard):
+    return GENERATION_KEY_TEMPLATE % (section, shard)
+
+
+def bump(section, pk):
+    '''
+    Содержимое шарда с этим pk изменилось - сохранённый XML устарел
+    '''
+    if pk is None:
+        return
+    try:
+        cache.incr(generation_key(section, shard_of(pk)))
+    except ValueError:
+        # Поколения нет - значит и шард ещё не сохранялся
+        pass
+
+
+def on_post_changed(sender, instance, created=True, **kwargs):
+    # Правка текста ни адрес, ни дату публикации не меняет
+    if not created:
+        return
+    bump('posts', instance.pk)
+    bump('profiles', instance.author_id)
+    bump('groups', instance.group_id)
+
+
+def on_group_changed(sender, instance, **kwargs):
+    bump('groups', instance.pk)
+
+
+def on_user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump('profiles', instance.pk)
+
+
+def shard_key(section, shard):
+    generation = generation_key(section, shard)
+    value = cache.get(generation)
+    if value is None:
+        # Запись в кеш только при первом обращении к шарду
+        cache.add(generation, 0, None)
+        value = cache.get(generation, 0)
+    return KEY_TEMPLATE % (section, shard, value)
+
+
+def lastmod(value):
+    return value.isoformat(timespec='seconds') if value else None
+
+
+def render_shard(section, shard):
+    '''
+    XML шарда по частям, по пачке адресов за раз
+    '''
+    rows, _ = SECTIONS[section]
+    size = option('SITEMAP_SHARD_SIZE')
+    site_url = settings.SITE_URL.rstrip('/')
+
+    yield URLSET_START
+    entries = []
+    for path, modified in rows(shard * size, (shard + 1) * size):
+        entry = f'<url><loc>{escape(site_url + path)}</loc>'
+        if modified:
+            entry += f'<lastmod>{lastmod(modified)}</lastmod>'
+        entries.append(entry + '</url>\n')
+
+        if len(entries) >= option('SITEMAP_CHUNK_SIZE'):
+            yield ''.join(entries)
+            entries = []
+    yield ''.join(entries)
+    yield URLSET_END
+
+
+def get_shard(section, shard):
+    '''
+    Сохранённый XML шарда или поток, который по ходу отдачи
+    собирает его и сохраняет целиком, когда отдан последний кусок
+    '''
+    key = shard_key(section, shard)
+    content = cache.get(key)
+    if content is not None:
+        return [content]
+    return cached_stream(key, render_shard(section, shard))
+
+
+def cached_stream(key, parts):
+    collected = []
+    for part in parts:
+        collected.append(part)
+        yield part
+    cache.set(key, ''.join(collected), option('SITEMAP_CACHE_TIMEOUT'))
+
+
+def render_index():
+    site_url = settings.SITE_URL.rstrip('/')
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/'
+             'sitemap/0.9">\n']
+    for section in SECTIONS:
+        for shard in range(shard_count(section)):
+            path = reverse('posts:sitemap_shard', args=[section, shard])
+            lines.append(f'<sitemap><loc>{escape(site_url + path)}</loc>'
+                         f'</sitemap>\n')
+    lines.append('</sitemapindex>\n')
+    return ''.join(lines)
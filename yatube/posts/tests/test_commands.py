@@ -0,0 +1,539 @@
+import shutil
+import tempfile
+from io import StringIO
+from os import makedirs, path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from .. import digest
+from ..cleanup import Collector
+from ..models import (ArchivedComment, ArchivedPost, Comment, DailyActivity,
+                      Follow, Group, Post)
+from ..recommendations import get_recommendations
+
+User = get_user_model()
+
+
+class SendDigestsTest(TestCase):
+    '''
+        Тестирование рассылки дайджестов новых постов
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.author = User.objects.create(username='author')
+        cls.other_author = User.objects.create(username='other_author')
+        cls.follower = User.objects.create(username='follower',
+                                           email='follower@example.com')
+        cls.no_email = User.objects.create(username='no_email')
+
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        Follow.objects.create(user=cls.follower, author=cls.other_author)
+        Follow.objects.create(user=cls.no_email, author=cls.author)
+
+        cls.old_post = Post.objects.create(text='Old post', author=cls.author)
+
+    def send(self):
+        mail.outbox = []
+        call_command('send_digests', stdout=StringIO())
+        return mail.outbox
+
+    def test_one_digest_per_follower(self):
+        '''
+            Подписчик получает одно письмо со всеми новыми постами
+        '''
+        self.send()
+        Post.objects.create(text='First new post', author=self.author)
+        Post.objects.create(text='Second new post', author=self.other_author)
+
+        outbox = self.send()
+
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(outbox[0].to, ['follower@example.com'])
+        self.assertIn('First new post', outbox[0].body)
+        self.assertIn('Second new post', outbox[0].body)
+        self.assertNotIn('Old post', outbox[0].body)
+
+    def test_post_sent_only_once(self):
+        '''
+            Повторный запуск не рассылает те же посты
+        '''
+        self.send()
+        Post.objects.create(text='New post', author=self.author)
+
+        self.assertEqual(len(self.send()), 1)
+        self.assertEqual(len(self.send()), 0)
+
+    def test_single_connection(self):
+        '''
+            Все пачки уходят через одно открытое соединение
+        '''
+        self.send()
+        Follow.objects.create(user=User.objects.create(
+            username='second', email='second@example.com'
+        ), author=self.author)
+        Post.objects.create(text='New post', author=self.author)
+
+        with mock.patch.object(locmem.EmailBackend, 'open') as opened:
+            sent = digest.send_digests(batch_size=1)
+
+        self.assertEqual(sent, 2)
+        opened.assert_called_once()
+
+    def test_overlapping_runs(self):
+        '''
+            Пока идёт одна рассылка, вторая ничего не отправляет
+        '''
+        self.send()
+        Post.objects.create(text='New post', author=self.author)
+        cache.add(digest.LOCK_KEY, 1, 60)
+
+        self.assertEqual(len(self.send()), 0)
+
+        cache.delete(digest.LOCK_KEY)
+        self.assertEqual(len(self.send()), 1)
+
+
+class BuildRecommendationsTest(TestCase):
+    '''
+        Тестирование рекомендаций "на кого подписаться"
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.users = {name: User.objects.create(username=name)
+                     for name in ('reader', 'friend', 'author',
+                                  'popular', 'fan', 'stranger')}
+        follows = [('reader', 'friend'),
+                   ('friend', 'popular'),
+                   ('fan', 'friend'),
+                   ('fan', 'author'),
+                   ('stranger', 'reader')]
+        for user, author in follows:
+            Follow.objects.create(user=cls.users[user],
+                                  author=cls.users[author])
+
+        call_command('build_recommendations', stdout=StringIO())
+
+    def usernames(self, name):
+        return [author['username']
+                for author in get_recommendations(self.users[name])]
+
+    def test_recommendations(self):
+        '''
+            Подписки подписок и авторы, которых читают вместе с моими
+        '''
+        recommended = self.usernames('reader')
+
+        self.assertEqual(recommended[0], 'popular')
+        self.assertIn('author', recommended)
+        self.assertNotIn('friend', recommended)
+        self.assertNotIn('reader', recommended)
+
+    def test_recommendations_on_pages(self):
+        '''
+            Рекомендации выводятся на странице подписок
+        '''
+        client = Client()
+        client.force_login(self.users['reader'])
+        response = client.get(reverse('posts:follow_index'))
+
+        self.assertEqual(response.context['recommendations'][0]['username'],
+                         'popular')
+
+
+class DailyActivityTest(TestCase):
+    '''
+        Тестирование дневных сводок активности
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(title='group', slug='group',
+                                         description='group')
+
+        posts = [Post.objects.create(text=f'post {i}', author=cls.author,
+                                     group=cls.group)
+                 for i in range(3)]
+        Comment.objects.create(post=posts[0], author=cls.author, text='1')
+        Comment.objects.create(post=posts[1], author=cls.reader, text='2')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        posts[2].delete()
+
+    def rollups(self):
+        return set(DailyActivity.objects.values_list(
+            'kind', 'object_id', 'day', 'posts', 'comments', 'followers'
+        ))
+
+    def test_incremental_matches_backfill(self):
+        '''
+            Сигналы дают те же сводки, что и пересборка
+        '''
+        incremental = self.rollups()
+        call_command('backfill_activity', stdout=StringIO())
+
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_activity_on_pages(self):
+        '''
+            Сегодняшняя активность есть на графиках профиля и группы
+        '''
+        profile = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+        today = profile.context['activity'][-1]
+        self.assertEqual((today['posts'], today['comments'],
+                          today['followers']), (2, 1, 1))
+
+        group = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'group'})
+        )
+        today = group.context['activity'][-1]
+        self.assertEqual((today['posts'], today['comments']), (2, 2))
+
+
+class ArchivePostsTest(TestCase):
+    '''
+        Тестирование переноса старых постов в архив
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+
+        cls.old_posts = [Post.objects.create(text=f'old {i}',
+                                             author=cls.author)
+                         for i in range(3)]
+        Comment.objects.create(post=cls.old_posts[0], author=cls.reader,
+                               text='Старый комментарий')
+        for i in range(9):
+            Post.objects.create(text=f'new {i}', author=cls.author)
+
+        for i, post in enumerate(cls.old_posts):
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=timezone.now() - timezone.timedelta(days=400 + i)
+            )
+
+    def archive(self):
+        call_command('archive_posts', '--batch-size=2', stdout=StringIO())
+
+    def test_old_posts_moved(self):
+        '''
+            Старые посты и их комментарии переезжают в архив,
+            сводки активности не меняются
+        '''
+        rollups = set(DailyActivity.objects.values_list('object_id', 'posts',
+                                                        'comments'))
+        self.archive()
+
+        self.assertEqual(Post.objects.count(), 9)
+        self.assertEqual(ArchivedPost.objects.count(), 3)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(ArchivedComment.objects.get().post_id,
+                         self.old_posts[0].pk)
+        self.assertEqual(set(DailyActivity.objects.values_list(
+            'object_id', 'posts', 'comments'
+        )), rollups)
+
+    def test_archived_post_detail(self):
+        '''
+            Архивный пост открывается по старой ссылке, но без
+            возможности комментировать
+        '''
+        self.archive()
+        client = Client()
+        client.force_login(self.reader)
+
+        url = reverse('posts:post_detail', args=[self.old_posts[0].pk])
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['archived'])
+        self.assertContains(response, 'Старый комментарий')
+        self.assertNotContains(response, 'comment-form')
+
+        response = client.post(
+            reverse('posts:add_comment', args=[self.old_posts[0].pk]),
+            {'text': 'Новый'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_profile_continues_with_archive(self):
+        '''
+            Профиль показывает сначала новые посты, затем архивные
+        '''
+        self.archive()
+        url = reverse('posts:profile', args=['author'])
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['old 1', 'old 2']
+        )
+
+    @override_settings(PAGINATOR_CACHE_MIN_COUNT=0)
+    def test_profile_count_cached(self):
+        '''
+            Количество постов профиля с архивом берётся из кеша
+            и сбрасывается архивированием
+        '''
+        cache.clear()
+        url = reverse('posts:profile', args=['author'])
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'COUNT(' in query['sql']])
+
+        self.archive()
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['old 1', 'old 2']
+        )
+
+
+class ExportStaticSiteTest(TestCase):
+    '''
+        Тестирование выгрузки страниц в HTML
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(title='group', slug='group',
+                                         description='group')
+        cls.post = Post.objects.create(text='Пост', author=cls.author,
+                                       group=cls.group)
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        cache.clear()
+
+    def export(self):
+        output = StringIO()
+        call_command('export_static_site', f'--output={self.root}',
+                     '--workers=1', stdout=output)
+        return output.getvalue()
+
+    def exported(self, *parts):
+        return path.join(self.root, *parts)
+
+    def test_first_export_is_full(self):
+        '''
+            Первая выгрузка рисует все страницы, повторная - ничего
+        '''
+        self.assertIn('Записано страниц: 4', self.export())
+
+        for name in (('index.html',),
+                     ('group', 'group', 'index.html'),
+                     ('profile', 'author', 'index.html'),
+                     ('posts', str(self.post.pk), 'index.html')):
+            self.assertTrue(path.exists(self.exported(*name)))
+
+        self.assertIn('Записано страниц: 0', self.export())
+
+    def test_only_changed_pages(self):
+        '''
+            После комментария перерисовывается только страница поста
+        '''
+        self.export()
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Новый комментарий')
+
+        self.assertIn('Записано страниц: 1', self.export())
+        with open(self.exported('posts', str(self.post.pk),
+                                'index.html')) as file:
+            self.assertIn('Новый комментарий', file.read())
+
+    def test_fragment_cache_bypassed(self):
+        '''
+            Закешированный фрагмент главной не попадает в выгрузку
+        '''
+        self.export()
+        self.client.get(reverse('posts:index'))
+        Post.objects.create(text='Свежий пост', author=self.author)
+
+        self.export()
+
+        with open(self.exported('index.html')) as file:
+            self.assertIn('Свежий пост', file.read())
+
+    def test_removed_pages(self):
+        '''
+            Страницы удалённого поста и лишние страницы ленты удаляются
+        '''
+        posts = [Post.objects.create(text=f'post {i}', author=self.author)
+                 for i in range(10)]
+        self.export()
+        self.assertTrue(path.exists(self.exported('index-2.html')))
+
+        posts[0].delete()
+        self.export()
+
+        self.assertFalse(path.exists(self.exported('index-2.html')))
+        self.assertFalse(path.exists(self.exported(
+            'posts', str(posts[0].pk), 'index.html'
+        )))
+
+
+class GcMediaTest(TestCase):
+    '''
+        Тестирование удаления осиротевших картинок и миниатюр
+    '''
+    gif = (b'\x47\x49\x46\x38\x39\x61\x02\x00\x01\x00\x80\x00\x00\x00'
+           b'\x00\x00\xFF\xFF\xFF\x21\xF9\x04\x00\x00\x00\x00\x00\x2C'
+           b'\x00\x00\x00\x00\x02\x00\x01\x00\x00\x02\x02\x0C\x0A\x00'
+           b'\x3B')
+
+    def setUp(self):
+        super().setUp()
+        # Иначе sorl-thumbnail найдёт миниатюру прошлого запуска в кеше
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+
+        author = User.objects.create(username='author')
+        self.post = Post(text='Пост', author=author)
+        self.post.image.save('live.gif', ContentFile(self.gif))
+        self.thumbnail = get_thumbnail(self.post.image, '10x10').name
+
+        self.orphans = ['posts/old.gif', 'cache/aa/bb/lost.jpg']
+        for name in self.orphans:
+            makedirs(path.dirname(self.path(name)), exist_ok=True)
+            with open(self.path(name), 'wb') as file:
+                file.write(self.gif)
+
+    def tearDown(self):
+        super().tearDown()
+        self.settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def path(self, name):
+        return path.join(self.media_root, name)
+
+    def gc(self, *args):
+        call_command('gc_media', '--min-age', '0', *args, stdout=StringIO())
+
+    def test_orphans_deleted(self):
+        '''
+            Удаляются только файлы без ссылок
+        '''
+        self.gc()
+
+        for name in self.orphans:
+            self.assertFalse(path.exists(self.path(name)), name)
+        self.assertTrue(path.exists(self.path(self.post.image.name)))
+        self.assertTrue(path.exists(self.path(self.thumbnail)))
+
+    def test_replaced_image_with_thumbnails(self):
+        '''
+            Заменённая картинка уходит вместе с миниатюрами
+        '''
+        old_image = self.post.image.name
+        self.post.image.save('new.gif', ContentFile(self.gif + b'new'))
+
+        self.gc()
+
+        self.assertFalse(path.exists(self.path(old_image)))
+        self.assertFalse(path.exists(self.path(self.thumbnail)))
+
+    def test_recheck_before_delete(self):
+        '''
+            Файл, на который сослались после проверки пачки, остаётся
+        '''
+        collector = Collector(min_age=0)
+        Post.objects.create(text='Повторная загрузка',
+                            author=self.post.author,
+                            image=self.orphans[0])
+
+        collector.delete(self.orphans[0], collector.delete_image)
+
+        self.assertTrue(path.exists(self.path(self.orphans[0])))
+        self.assertEqual(collector.deleted, 0)
+
+    def test_dry_run(self):
+        '''
+            При --dry-run ничего не удаляется
+        '''
+        self.gc('--dry-run')
+
+        for name in self.orphans:
+            self.assertTrue(path.exists(self.path(name)), name)
+
+
+class ImagePreviewTest(TestCase):
+    '''
+        Тестирование размеров и превью картинок постов
+    '''
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.author = User.objects.create(username='author')
+
+    def tearDown(self):
+        super().tearDown()
+        self.settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_described_on_upload(self):
+        '''
+            Превью считается при загрузке и выводится в ленте
+        '''
+        post = Post(text='Пост', author=self.author)
+        post.image.save('image.gif', ContentFile(GcMediaTest.gif))
+
+        post.refresh_from_db()
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/png;base64,')
+        )
+
+        response = Client().get(reverse('posts:profile', args=['author']))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, post.image_placeholder)
+
+    def test_backfill(self):
+        '''
+            Команда заполняет превью для старых картинок
+        '''
+        makedirs(path.join(self.media_root, 'posts'))
+        with open(path.join(self.media_root, 'posts', 'old.gif'), 'wb') as f:
+            f.write(GcMediaTest.gif)
+        post = Post.objects.create(text='Пост', author=self.author,
+                                   image='posts/old.gif')
+
+        call_command('describe_images', stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertNotEqual(post.image_placeholder, '')
@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Task
+from core.tasks import claim_tasks, run_task
+
+from .. import lookups
+from ..deletion import delete_group, delete_user
+from ..models import Comment, Deletion, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(DELETION_BATCH_SIZE=2, DELETION_BATCHES_PER_TASK=3)
+class DeletionTest(TestCase):
+    '''
+        Тестирование фонового удаления пользователей и групп
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.author = User.objects.create(username='prolific')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='doomed')
+
+        posts = [Post.objects.create(text=f'Пост {i}', author=cls.author,
+                                     group=cls.group)
+                 for i in range(4)]
+        for post in posts:
+            Comment.objects.create(post=post, author=cls.reader, text='Ок')
+        Comment.objects.create(post=Post.objects.create(text='Чужой',
+                                                        author=cls.reader,
+                                                        group=cls.group),
+                               author=cls.author, text='Ок')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        super().setUp()
+        lookups.users.clear()
+        lookups.groups.clear()
+
+    def run_queue(self):
+        '''
+            Выполнение очереди до конца, возвращает число запусков
+        '''
+        runs = 0
+        while True:
+            claimed = claim_tasks(10)
+            if not claimed:
+                return runs
+            for pk in claimed:
+                self.assertEqual(run_task(pk), Task.DONE)
+                runs += 1
+
+    def test_user_hidden_immediately(self):
+        '''
+            Страница и посты пользователя пропадают сразу
+        '''
+        delete_user(self.author)
+        client = Client()
+
+        response = client.get(reverse('posts:profile', args=['prolific']))
+        self.assertEqual(response.status_code, 404)
+
+        response = client.get(reverse('posts:index'))
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_user_deleted_in_batches(self):
+        '''
+            Зависимые записи удаляются за несколько запусков задачи
+        '''
+        deletion = delete_user(self.author)
+
+        self.assertGreater(self.run_queue(), 1)
+
+        deletion.refresh_from_db()
+        self.assertIsNotNone(deletion.finished)
+        # подписка, комментарии автора и к его постам, посты,
+        # дневная активность автора и сам пользователь
+        self.assertEqual(deletion.removed, 1 + 1 + 4 + 4 + 1 + 1)
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 0)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_group_deleted(self):
+        '''
+            Группа скрывается сразу, посты остаются без группы
+        '''
+        deletion = delete_group(self.group)
+        response = Client().get(reverse('posts:group_list', args=['doomed']))
+        self.assertEqual(response.status_code, 404)
+
+        self.run_queue()
+
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.kind, Deletion.GROUP)
+        self.assertIsNotNone(deletion.finished)
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists())
+        self.assertEqual(Post.objects.filter(group__isnull=True).count(), 5)
@@ -1,5 +1,6 @@
 import shutil
 import tempfile
+from http import HTTPStatus
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -8,6 +9,8 @@ from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from test_utils import Url
 
+from core.storage import content_address
+
 from ..models import Comment, Post
 
 User = get_user_model()
@@ -63,7 +66,7 @@ class TestPostForms(TestCase):
                 Post.objects.filter(
                     author=TestPostForms.user,
                     text='test text',
-                    image='posts/test.gif'
+                    image=content_address('posts/test.gif', uploaded)
                 ).exists()
             )
 
@@ -92,7 +95,8 @@ class TestPostForms(TestCase):
         post.refresh_from_db()
         self.assertEqual(post.text, 'new text',
                          msg='Не изменился текст')
-        self.assertEqual(post.image, 'posts/test2.gif',
+        self.assertEqual(post.image,
+                         content_address('posts/test2.gif', uploaded),
                          msg='Не изменилось изображение')
 
 
@@ -124,3 +128,35 @@ class CommentTest(TestCase):
         resp = self.client.post(add_comment_url.url, add_comment_url.post_data)
 
         self.assertEqual(count_comments + 1, Comment.objects.count(), msg=resp)
+
+    def test_create_comment_by_fetch(self):
+        """
+            Создание комментария через fetch возвращает только его разметку
+        """
+        url = reverse('posts:add_comment',
+                      kwargs={'post_id': CommentTest.post.pk})
+
+        resp = self.client.post(url, {'text': 'fetched comment'},
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(resp.status_code, HTTPStatus.CREATED)
+        self.assertTemplateUsed(resp, 'posts/includes/comment.html')
+        self.assertTemplateNotUsed(resp, 'posts/post_detail.html')
+        self.assertIn('fetched comment', resp.content.decode())
+        self.assertTrue(Comment.objects.filter(text='fetched comment')
+                                       .exists())
+
+    def test_comment_errors_by_fetch(self):
+        """
+            Ошибки формы через fetch приходят отдельным фрагментом
+        """
+        url = reverse('posts:add_comment',
+                      kwargs={'post_id': CommentTest.post.pk})
+
+        resp = self.client.post(url, {'text': ''},
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(resp.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertTemplateUsed(resp, 'includes/form_errors.html')
+        self.assertTemplateNotUsed(resp, 'posts/post_detail.html')
+        self.assertIn('alert-danger', resp.content.decode())
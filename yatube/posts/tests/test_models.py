@@ -1,6 +1,12 @@
-from django.test import TestCase
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 
+from core.models import StoredFile
 from posts.models import Post, Group
 
 User = get_user_model()
@@ -37,3 +43,119 @@ class GroupModelTest(TestCase):
             str(GroupModelTest.group),
             'A' * 30,
             '__str__ Не выводит название группы')
+
+
+class FeedQuerySetTest(TestCase):
+    '''
+        Тестирование выборки постов для лент
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.author = User.objects.create(username='author',
+                                         first_name='Имя',
+                                         last_name='Фамилия')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(text='Пост', author=cls.author,
+                                       group=cls.group)
+        Post.objects.create(text='Без группы', author=cls.author)
+
+    def test_only_card_columns(self):
+        '''Лишние колонки автора и группы не загружаются'''
+        with self.assertNumQueries(1):
+            post = Post.objects.for_feed().get(pk=self.post.pk)
+            self.assertEqual(post.author.get_full_name(), 'Имя Фамилия')
+            self.assertEqual(post.group.slug, 'group')
+
+        self.assertIn('password', post.author.get_deferred_fields())
+        self.assertIn('description', post.group.get_deferred_fields())
+
+    def test_rows(self):
+        '''rows=True отдаёт лёгкие объекты с теми же атрибутами'''
+        with self.assertNumQueries(1):
+            rows = list(Post.objects.for_feed(rows=True))
+
+        self.assertEqual([row.pk for row in rows],
+                         list(Post.objects.values_list('pk', flat=True)))
+        row = next(row for row in rows if row.pk == self.post.pk)
+        self.assertEqual(row.text, 'Пост')
+        self.assertEqual(row.author.get_full_name(), 'Имя Фамилия')
+        self.assertEqual(row.group.slug, 'group')
+        self.assertFalse(hasattr(row, '__dict__'))
+        self.assertIsNone(next(row for row in rows
+                               if row.pk != self.post.pk).group)
+
+    def test_rows_in_template(self):
+        '''Карточка из строки знает автора: своему посту кнопки нет'''
+        reader = User.objects.create(username='reader')
+        template = Template(
+            '{% for post in posts %}'
+            '{% include "posts/includes/follow_button.html" with '
+            'author_id=post.author_id username=post.author.username %}'
+            '{% endfor %}'
+        )
+        posts = Post.objects.filter(pk=self.post.pk).for_feed(rows=True)
+
+        for user, followed, button in ((self.author, set(), None),
+                                       (reader, set(), 'Подписаться'),
+                                       (reader, {self.author.pk},
+                                        'Отписаться')):
+            with self.subTest(user=user.username, followed=followed):
+                html = template.render(Context({'posts': posts,
+                                                'user': user,
+                                                'followed': followed}))
+                if button is None:
+                    self.assertEqual(html.strip(), '')
+                else:
+                    self.assertIn(button, html)
+
+
+class ImageReleaseTest(TransactionTestCase):
+    '''
+        Картинка освобождается при замене и удалении поста
+    '''
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        self.author = User.objects.create(username='author')
+
+    def post_with_image(self, content):
+        post = Post(text='Пост', author=self.author)
+        post.image.save('image.gif', ContentFile(content))
+        return post
+
+    def test_shared_image(self):
+        '''
+            Общий файл удаляется вместе с последним постом
+        '''
+        first = self.post_with_image(b'same')
+        second = self.post_with_image(b'same')
+        name = first.image.name
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+
+        first.delete()
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        self.assertTrue(second.image.storage.exists(name))
+
+        second.delete()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(second.image.storage.exists(name))
+
+    def test_replaced_image(self):
+        '''
+            Заменённая картинка удаляется
+        '''
+        post = self.post_with_image(b'old')
+        old = post.image.name
+
+        post.image.save('new.gif', ContentFile(b'new'))
+
+        self.assertFalse(post.image.storage.exists(old))
+        self.assertTrue(post.image.storage.exists(post.image.name))
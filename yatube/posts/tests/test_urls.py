@@ -34,6 +34,11 @@ class PostsUrlTests(TestCase):
                 default_template='posts/index.html',
                 default_status=HTTPStatus.OK),
 
+            Url(reverse('posts:trending'),
+                default_template='posts/trending.html',
+                default_status=HTTPStatus.OK,
+                help_text='Популярное'),
+
             Url(reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
                 default_template='posts/group_list.html',
                 default_status=HTTPStatus.OK,
@@ -1,17 +1,26 @@
 import shutil
 import tempfile
+import threading
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import Http404
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from test_utils import (Form, IndividualField, IndividualObject,
                         IterableWithLen, ObjectsInList, Url)
 
-from ..models import Comment, Follow, Group, Post
+from core.paginator import CachedCountPaginator, generation_key
+
+from .. import lookups
+from ..models import (ArchivedPost, Comment, Follow, Group, Post,
+                      TrendingBucket)
+from ..trending import LOCK_KEY_TEMPLATE, get_top
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -250,6 +259,16 @@ class CommentsTest(TestCase):
                 resp_context = response.context.get(context.context_name)
                 self.assertEqual(context, resp_context)
 
+    def test_comment_form_only_for_authorized(self):
+        '''
+            Анониму форма комментария не показывается
+        '''
+        url = reverse('posts:post_detail',
+                      kwargs={'post_id': CommentsTest.post.pk})
+
+        self.assertContains(self.client.get(url), 'comment-form')
+        self.assertNotContains(Client().get(url), 'comment-form')
+
 
 class FollowTest(TestCase):
     '''
@@ -310,6 +329,165 @@ class FollowTest(TestCase):
         self.check_context(url, response)
 
 
+class FollowButtonsTest(TestCase):
+    '''
+        Тестирование кнопок подписки в карточках постов
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = User.objects.create(username='reader')
+        cls.authors = [User.objects.create(username=f'writer_{i}')
+                       for i in range(5)]
+        cls.group = Group.objects.create(title='Группа', slug='buttons')
+
+        for author in cls.authors:
+            Post.objects.create(text='Пост', author=author, group=cls.group)
+
+        Follow.objects.create(user=cls.user, author=cls.authors[0])
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        self.client = Client()
+        self.client.force_login(FollowButtonsTest.user)
+
+    def test_buttons_in_cards(self):
+        '''
+            В карточках есть кнопки подписки и отписки
+        '''
+        follow = reverse('posts:profile_follow', args=['writer_1'])
+        unfollow = reverse('posts:profile_unfollow', args=['writer_0'])
+
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_list', args=['buttons'])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, follow)
+                self.assertContains(response, unfollow)
+
+    def test_state_changes_after_follow(self):
+        '''
+            После подписки кнопка меняется сразу
+        '''
+        url = reverse('posts:group_list', args=['buttons'])
+        self.client.get(url)
+
+        self.client.get(reverse('posts:profile_follow', args=['writer_1']))
+
+        self.assertContains(self.client.get(url),
+                            reverse('posts:profile_unfollow',
+                                    args=['writer_1']))
+
+    def test_index_fragment_shared(self):
+        '''
+            Пользователи с одинаковыми кнопками получают общий фрагмент
+        '''
+        first, other = (User.objects.create(username=f'new_reader_{i}')
+                        for i in range(2))
+        client = Client()
+        client.force_login(first)
+        client.get(reverse('posts:index'))
+        # update() не сбрасывает кеш - по тексту видно, чей фрагмент
+        Post.objects.update(text='Изменённый')
+
+        client.force_login(other)
+        self.assertNotContains(client.get(reverse('posts:index')),
+                               'Изменённый')
+
+        Follow.objects.create(user=other, author=self.authors[0])
+        self.assertContains(client.get(reverse('posts:index')),
+                            'Изменённый')
+
+    def test_one_query_for_all_cards(self):
+        '''
+            Подписки читаются один раз на страницу, затем из кеша
+        '''
+        url = reverse('posts:group_list', args=['buttons'])
+        self.client.get(url)
+
+        Post.objects.create(text='Ещё пост', author=self.authors[1],
+                            group=self.group)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'posts_follow' in query['sql']])
+
+
+class LookupCacheTest(TestCase):
+    '''
+        Тестирование кеша пользователей и групп по адресу
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = User.objects.create(username='cached_author')
+        cls.group = Group.objects.create(title='Группа', slug='cached')
+
+    def setUp(self):
+        super().setUp()
+        lookups.users.clear()
+        lookups.groups.clear()
+
+    def test_found_and_missing_cached(self):
+        '''
+            Повторный поиск по адресу не ходит в базу, в том числе
+            за несуществующим объектом
+        '''
+        for lookup, key in ((lookups.get_user_or_404, 'cached_author'),
+                            (lookups.get_group_or_404, 'cached'),
+                            (lookups.get_user_or_404, 'nobody')):
+            with self.subTest(key=key):
+                try:
+                    lookup(key)
+                except Http404:
+                    pass
+
+                with self.assertNumQueries(0):
+                    try:
+                        lookup(key)
+                    except Http404:
+                        pass
+
+    def test_invalidation(self):
+        '''
+            Создание, переименование и удаление сбрасывают кеш
+        '''
+        with self.assertRaises(Http404):
+            lookups.get_group_or_404('new')
+        new_group = Group.objects.create(title='Новая', slug='new')
+        self.assertEqual(lookups.get_group_or_404('new'), new_group)
+
+        lookups.get_user_or_404('cached_author')
+        self.user.username = 'renamed'
+        self.user.save()
+        with self.assertRaises(Http404):
+            lookups.get_user_or_404('cached_author')
+
+        new_group.delete()
+        with self.assertRaises(Http404):
+            lookups.get_group_or_404('new')
+
+    def test_invalidation_from_other_process(self):
+        '''
+            Изменение в другом воркере сбрасывает кеш этого процесса
+            через поколение в общем кеше
+        '''
+        lookups.get_user_or_404('cached_author')
+        # Сигнал сработал в другом процессе: до локального кеша
+        # он не дошёл, сдвинулось только поколение
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(lookups.get_user_or_404('cached_author'), self.user)
+
+        lookups.bump_generation('users')
+        with self.assertRaises(Http404):
+            lookups.get_user_or_404('cached_author')
+
+
 class CacheTest(TestCase):
     '''
         Тестирование кеширования страниц
@@ -335,6 +513,21 @@ class CacheTest(TestCase):
         self.test_post = Post.objects.create(text=self.test_text,
                                              author=CacheTest.author)
 
+    def test_count_generation_signals(self):
+        '''
+            Счётчики лент сбрасываются постами, а не любой записью
+        '''
+        cache.clear()
+        CachedCountPaginator(Post.objects.all(), 10).count
+        generation = cache.get(generation_key(Post))
+
+        Comment.objects.create(post=self.test_post, author=self.author,
+                               text='Комментарий')
+        self.assertIsNone(cache.get(generation_key(Comment)))
+
+        Post.objects.create(text='Новый', author=self.author)
+        self.assertEqual(cache.get(generation_key(Post)), generation + 1)
+
     def test_index_page_cache(self):
         '''
             Тестирование кеширования на главной странице
@@ -383,3 +576,153 @@ class CacheTest(TestCase):
         self.assertNotIn(self.test_text,
                          self.client.get(page_url).content.decode(),
                          'Таймаут кеширования больше установленного')
+
+
+class TrendingTest(TestCase):
+    '''
+        Тестирование вкладки популярного
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cache.clear()
+
+        cls.user = User.objects.create(username='trending_user')
+        cls.quiet_group = Group.objects.create(title='Quiet group',
+                                               slug='quiet-group',
+                                               description='quiet')
+        cls.group = Group.objects.create(title='Active group',
+                                         slug='active-group',
+                                         description='active')
+
+        cls.quiet_post = Post.objects.create(text='quiet post',
+                                             author=cls.user,
+                                             group=cls.quiet_group)
+        cls.hot_post = Post.objects.create(text='hot post',
+                                           author=cls.user,
+                                           group=cls.group)
+        Post.objects.create(text='another post',
+                            author=cls.user,
+                            group=cls.group)
+
+        Comment.objects.create(post=cls.quiet_post, author=cls.user,
+                               text='comment')
+        for i in range(3):
+            Comment.objects.create(post=cls.hot_post, author=cls.user,
+                                   text=f'comment {i}')
+
+    def test_trending_order(self):
+        '''
+            Посты и группы отсортированы по активности
+        '''
+        response = self.client.get(reverse('posts:trending'))
+
+        posts = [post for post, _ in response.context['posts']]
+        groups = [group for group, _ in response.context['groups']]
+        self.assertEqual(posts, [self.hot_post, self.quiet_post])
+        self.assertEqual(groups, [self.group, self.quiet_group])
+        self.assertEqual(response.context['posts'][0][1]['comments'], 3)
+
+    def test_top_rebuilt_from_buckets(self):
+        '''
+            Топ восстанавливается по счетчикам, если выпал из кеша
+        '''
+        top = get_top(TrendingBucket.POST)
+        cache.clear()
+
+        self.assertEqual(get_top(TrendingBucket.POST), top)
+
+    def test_update_waits_for_lock(self):
+        '''
+            Событие, пришедшее во время чужого обновления топа,
+            дожидается блокировки, а не теряется
+        '''
+        get_top(TrendingBucket.POST)
+        lock_key = LOCK_KEY_TEMPLATE % TrendingBucket.POST
+        cache.add(lock_key, 1, 5)
+        threading.Timer(0.05, cache.delete, [lock_key]).start()
+
+        post = Post.objects.create(text='new post', author=self.user)
+        Comment.objects.create(post=post, author=self.user, text='first')
+
+        posts = [post_id for post_id, _ in get_top(TrendingBucket.POST)]
+        self.assertIn(post.pk, posts)
+
+
+@override_settings(SITE_URL='http://yatube.test', SITEMAP_CHUNK_SIZE=2)
+class SitemapTest(TestCase):
+    '''
+        Тестирование карты сайта
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.author = User.objects.create(username='author')
+        cls.hidden = User.objects.create(username='hidden', is_active=False)
+        cls.group = Group.objects.create(title='group', slug='group',
+                                         description='group')
+        cls.posts = [Post.objects.create(text=f'post {i}', author=cls.author,
+                                         group=cls.group)
+                     for i in range(5)]
+        cls.hidden_post = Post.objects.create(text='hidden',
+                                              author=cls.hidden)
+        cls.archived = ArchivedPost.objects.create(
+            id=cls.posts[-1].pk + 100, text='archived', author=cls.author,
+            pub_date=cls.posts[0].pub_date
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def shard(self, section):
+        response = self.client.get(reverse('posts:sitemap_shard',
+                                           args=[section, 0]))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_index(self):
+        '''
+            Индекс ссылается на шарды всех разделов
+        '''
+        response = self.client.get(reverse('posts:sitemap'))
+
+        for section in ('posts', 'profiles', 'groups'):
+            self.assertContains(response,
+                                f'http://yatube.test/sitemaps/{section}/0.xml')
+
+    def test_shards(self):
+        '''
+            В шардах только видимые страницы, дата - из pub_date
+        '''
+        posts = self.shard('posts')
+        for post in (*self.posts, self.archived):
+            self.assertIn(f'http://yatube.test/posts/{post.pk}/</loc>'
+                          f'<lastmod>{post.pub_date.isoformat("T", "seconds")}'
+                          f'</lastmod>', posts)
+        self.assertNotIn(f'/posts/{self.hidden_post.pk}/', posts)
+
+        profiles = self.shard('profiles')
+        self.assertIn('/profile/author/', profiles)
+        self.assertNotIn('/profile/hidden/', profiles)
+
+        self.assertIn('/group/group/', self.shard('groups'))
+
+        response = self.client.get(reverse('posts:sitemap_shard',
+                                           args=['posts', 1000]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_shard_cached_until_changed(self):
+        '''
+            Шард берётся из кеша, пока в его диапазоне нет новых постов
+        '''
+        before = self.shard('posts')
+        # update() без сигналов - сохранённый шард не устаревает
+        Post.objects.filter(pk=self.posts[0].pk).update(
+            pub_date=self.archived.pub_date.replace(year=2000)
+        )
+        self.assertEqual(self.shard('posts'), before)
+
+        post = Post.objects.create(text='new', author=self.author)
+        self.assertIn(f'/posts/{post.pk}/', self.shard('posts'))
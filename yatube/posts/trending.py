@@ -0,0 +1,244 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import TrendingBucket
+
+BUCKET_SECONDS = 60 * 60
+TOP_KEY_TEMPLATE = 'trending.top.%s'
+LOCK_KEY_TEMPLATE = 'trending.top.%s.lock'
+# Раз в неделю переносим точку отсчёта весов, чтобы 2 ** x не разрастался
+REBASE_BUCKETS = 24 * 7
+# Сколько раз и с какой паузой ждать блокировку топа
+LOCK_ATTEMPTS = 20
+LOCK_DELAY = 0.01
+
+
+def current_bucket():
+    return int(time.time() // BUCKET_SECONDS)
+
+
+def option(name):
+    defaults = {
+        'TRENDING_HALF_LIFE': 6,
+        'TRENDING_WINDOW': 48,
+        'TRENDING_TOP_SIZE': 20,
+        'TRENDING_POST_WEIGHT': 3,
+        'TRENDING_COMMENT_WEIGHT': 1,
+        'TRENDING_TOP_TIMEOUT': 10 * 60,
+    }
+    return getattr(settings, name, defaults[name])
+
+
+def bucket_weight(posts, comments):
+    return (posts * option('TRENDING_POST_WEIGHT')
+            + comments * option('TRENDING_COMMENT_WEIGHT'))
+
+
+def normalized_score(buckets, anchor):
+    '''
+    Затухающий рейтинг, приведённый к часу anchor
+
+    Вес события растёт как 2 ** (час / период полураспада), поэтому
+    рейтинги без новых событий со временем не нужно пересчитывать:
+    все они затухают одинаково и их порядок не меняется
+    '''
+    half_life = option('TRENDING_HALF_LIFE')
+    return sum(bucket_weight(posts, comments)
+               * 2 ** ((bucket - anchor) / half_life)
+               for bucket, posts, comments in buckets)
+
+
+def record(kind, object_id, posts=0, comments=0):
+    '''
+    Учёт события в часовом счетчике и обновление топа
+    '''
+    bucket = current_bucket()
+    counters = TrendingBucket.objects.filter(kind=kind,
+                                             object_id=object_id,
+                                             bucket=bucket)
+    changes = {'posts': F('posts') + posts,
+               'comments': F('comments') + comments}
+
+    if not counters.update(**changes):
+        try:
+            with transaction.atomic():
+                TrendingBucket.objects.create(kind=kind,
+                                              object_id=object_id,
+                                              bucket=bucket,
+                                              posts=posts,
+                                              comments=comments)
+        except IntegrityError:
+            counters.update(**changes)
+
+    update_top(kind, object_id)
+
+
+def item_buckets(kind, object_id, since):
+    return list(TrendingBucket.objects
+                .filter(kind=kind, object_id=object_id, bucket__gte=since)
+                .values_list('bucket', 'posts', 'comments'))
+
+
+def update_top(kind, object_id):
+    '''
+    Пересчёт рейтинга одного объекта по его собственным счетчикам
+    и вставка в закешированный топ
+
+    Топ меняется под блокировкой в кеше, занятую другим процессом
+    ждём. Если не дождались, обновление пропускается: рейтинг
+    объекта поправит следующее его событие или пересборка топа
+    по истечении TRENDING_TOP_TIMEOUT
+    '''
+    lock_key = LOCK_KEY_TEMPLATE % kind
+    if not lock_top(lock_key):
+        return
+
+    try:
+        now = current_bucket()
+        top = cache.get(TOP_KEY_TEMPLATE % kind)
+        if top is None:
+            top = build_top(kind)
+        top = rebase(top, now)
+
+        buckets = item_buckets(kind, object_id,
+                               now - option('TRENDING_WINDOW'))
+        if buckets:
+            top['items'][object_id] = (
+                normalized_score(buckets, top['anchor']),
+                max(bucket for bucket, _, _ in buckets)
+            )
+        else:
+            top['items'].pop(object_id, None)
+
+        save_top(kind, top)
+    finally:
+        cache.delete(lock_key)
+
+
+def lock_top(lock_key):
+    for _ in range(LOCK_ATTEMPTS):
+        if cache.add(lock_key, 1, 5):
+            return True
+        time.sleep(LOCK_DELAY)
+    return False
+
+
+def rebase(top, now):
+    if now - top['anchor'] < REBASE_BUCKETS:
+        return top
+
+    factor = 2 ** ((top['anchor'] - now) / option('TRENDING_HALF_LIFE'))
+    return {
+        'anchor': now,
+        'items': {object_id: (score * factor, last_bucket)
+                  for object_id, (score, last_bucket)
+                  in top['items'].items()},
+    }
+
+
+def save_top(kind, top):
+    # Храним с запасом, чтобы после отсечения неактивных
+    # объектов всё равно набрался полный топ. Время жизни
+    # ограничено, чтобы пропущенные обновления не копились:
+    # по его истечении топ собирается заново по счетчикам
+    capacity = option('TRENDING_TOP_SIZE') * 2
+    items = sorted(top['items'].items(),
+                   key=lambda item: item[1][0],
+                   reverse=True)[:capacity]
+
+    cache.set(TOP_KEY_TEMPLATE % kind,
+              {'anchor': top['anchor'], 'items': dict(items)},
+              option('TRENDING_TOP_TIMEOUT'))
+
+
+def build_top(kind):
+    '''
+    Восстановление топа по счетчикам за окно, если он выпал из кеша
+    '''
+    now = current_bucket()
+    buckets = defaultdict(list)
+    for object_id, bucket, posts, comments in (
+            TrendingBucket.objects
+            .filter(kind=kind, bucket__gte=now - option('TRENDING_WINDOW'))
+            .values_list('object_id', 'bucket', 'posts', 'comments')):
+        buckets[object_id].append((bucket, posts, comments))
+
+    return {
+        'anchor': now,
+        'items': {object_id: (normalized_score(rows, now),
+                              max(bucket for bucket, _, _ in rows))
+                  for object_id, rows in buckets.items()},
+    }
+
+
+def rebuild_top(kind):
+    top = build_top(kind)
+    save_top(kind, top)
+    return top
+
+
+def get_top(kind):
+    '''
+    Топ объектов: [(object_id, рейтинг на текущий час)]
+
+    Отдаётся из кеша, объекты без событий за окно отбрасываются
+    '''
+    now = current_bucket()
+    top = cache.get(TOP_KEY_TEMPLATE % kind)
+    if top is None:
+        top = rebuild_top(kind)
+
+    factor = 2 ** ((top['anchor'] - now) / option('TRENDING_HALF_LIFE'))
+    since = now - option('TRENDING_WINDOW')
+    items = sorted(((object_id, score * factor)
+                    for object_id, (score, last_bucket)
+                    in top['items'].items()
+                    if last_bucket >= since),
+                   key=lambda item: item[1],
+                   reverse=True)
+
+    return items[:option('TRENDING_TOP_SIZE')]
+
+
+def get_velocity(kind, object_ids, hours):
+    '''
+    Количество постов и комментариев за последние hours часов
+    для объектов из топа
+    '''
+    since = current_bucket() - hours + 1
+    velocity = {object_id: {'posts': 0, 'comments': 0}
+                for object_id in object_ids}
+
+    for object_id, posts, comments in (
+            TrendingBucket.objects
+            .filter(kind=kind, object_id__in=object_ids, bucket__gte=since)
+            .values_list('object_id', 'posts', 'comments')):
+        velocity[object_id]['posts'] += posts
+        velocity[object_id]['comments'] += comments
+
+    return velocity
+
+
+def on_post_saved(sender, instance, created, **kwargs):
+    if created and instance.group_id:
+        record(TrendingBucket.GROUP, instance.group_id, posts=1)
+
+
+def on_comment_saved(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    record(TrendingBucket.POST, instance.post_id, comments=1)
+    if instance.post.group_id:
+        record(TrendingBucket.GROUP, instance.post.group_id, comments=1)
+
+
+def on_post_deleted(sender, instance, **kwargs):
+    TrendingBucket.objects.filter(kind=TrendingBucket.POST,
+                                  object_id=instance.pk).delete()
+    update_top(TrendingBucket.POST, instance.pk)
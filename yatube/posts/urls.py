@@ -6,6 +6,7 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('trending/', views.trending, name='trending'),
     path('group/<slug:slug>/', views.group_post, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
@@ -23,5 +24,10 @@ urlpatterns = [
 
     path('profile/<str:username>/unfollow/',
          views.profile_unfollow,
-         name='profile_unfollow')
+         name='profile_unfollow'),
+
+    path('sitemap.xml', views.sitemap_index, name='sitemap'),
+    path('sitemaps/<slug:section>/<int:shard>.xml',
+         views.sitemap_shard,
+         name='sitemap_shard')
 ]
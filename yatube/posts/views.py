@@ -1,9 +1,23 @@
+from http import HTTPStatus
+
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from core.paginator import CachedCountPaginator
+
+from .activity import get_activity
+from .archive import ArchiveChain
+from .follows import get_buttons_state, get_followed_authors
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
+from .lookups import get_group_or_404, get_user_or_404
+from .models import (ArchivedPost, Comment, DailyActivity, Follow, Group,
+                     Post, TrendingBucket, User)
+from .recommendations import get_recommendations
+from .sitemaps import SECTIONS, get_shard, render_index, shard_count
+from .trending import get_top, get_velocity
+
+POSTS_PER_PAGE = 10
 
 
 def index(request):
@@ -11,33 +25,66 @@ def index(request):
     Главная страница проекта Yatube
     '''
 
-    posts = Post.objects.select_related('group', 'author').all()
+    posts = Post.objects.visible().for_feed()
 
-    paginator = Paginator(posts, 10)
+    paginator = CachedCountPaginator(posts, POSTS_PER_PAGE)
 
     page_number = request.GET.get('page', 1)
 
     page_obj = paginator.get_page(page_number)
 
+    followed = get_followed_authors(request.user)
+
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'followed': followed,
+        'buttons_state': get_buttons_state(request.user, followed, page_obj)
     }
 
     return render(request, 'posts/index.html', context)
 
 
+def trending(request):
+    '''
+    Популярные посты и группы за последнее время
+    '''
+
+    top_posts = get_top(TrendingBucket.POST)
+    top_groups = get_top(TrendingBucket.GROUP)
+
+    post_ids = [object_id for object_id, _ in top_posts]
+    group_ids = [object_id for object_id, _ in top_groups]
+
+    # Топ уже отсортирован, из базы только достаём объекты по id
+    posts = (Post.objects.visible()
+                         .select_related('group', 'author')
+                         .in_bulk(post_ids))
+    groups = Group.objects.in_bulk(group_ids)
+
+    post_velocity = get_velocity(TrendingBucket.POST, post_ids, 24)
+    group_velocity = get_velocity(TrendingBucket.GROUP, group_ids, 24)
+
+    context = {
+        'trending': True,
+        'posts': [(posts[pk], post_velocity[pk])
+                  for pk in post_ids if pk in posts],
+        'groups': [(groups[pk], group_velocity[pk])
+                   for pk in group_ids if pk in groups],
+    }
+
+    return render(request, 'posts/trending.html', context)
+
+
 def group_post(request, slug):
     '''
     Отображение всех постов определенной группы
     '''
 
-    group = get_object_or_404(Group, slug=slug)
+    group = get_group_or_404(slug)
 
-    posts = (Post.objects.filter(group=group)
-                         .select_related('group', 'author')
-                         .all())
+    posts = Post.objects.filter(group=group).visible().for_feed()
 
-    paginator = Paginator(posts, 10)
+    paginator = CachedCountPaginator(posts, POSTS_PER_PAGE)
 
     page_number = request.GET.get('page', 1)
 
@@ -45,7 +92,9 @@ def group_post(request, slug):
 
     context = {
         'group': group,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'activity': get_activity(DailyActivity.GROUP, group.pk),
+        'followed': get_followed_authors(request.user)
     }
 
     return render(request, 'posts/group_list.html', context)
@@ -56,11 +105,14 @@ def profile(request, username):
     Отображение информации об определенном пользователе и его постах
     '''
 
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
 
-    posts = author.posts.select_related('group').all()
+    # Старые посты автора лежат в архиве (posts.archive),
+    # страницы профиля продолжаются ими
+    posts = ArchiveChain(author.posts.for_feed(),
+                         author.archived_posts.for_feed())
 
-    paginator = Paginator(posts, 10)
+    paginator = CachedCountPaginator(posts, POSTS_PER_PAGE)
 
     page_number = request.GET.get('page', 1)
 
@@ -68,12 +120,13 @@ def profile(request, username):
 
     context = {
         'profile_user': author,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'recommendations': get_recommendations(request.user),
+        'activity': get_activity(DailyActivity.AUTHOR, author.pk)
     }
 
-    if request.user.is_authenticated:
-        if Follow.objects.filter(user=request.user, author=author).exists():
-            context['following'] = True
+    if author.pk in get_followed_authors(request.user):
+        context['following'] = True
     # profile_user вместо user, чтобы не переопределять то,
     # что добавляет встроенный в django context_processor auth
     # (в противном случае баги в шапке)
@@ -86,11 +139,17 @@ def post_detail(request, post_id, override_comment_form=None):
         Отображение информации определенного поста
     '''
 
-    post = get_object_or_404(Post, pk=post_id)
+    post = Post.objects.visible().filter(pk=post_id).first()
+    archived = post is None
+    if archived:
+        # Старый пост, перенесённый в архив: только для чтения
+        post = get_object_or_404(ArchivedPost.objects.visible(), pk=post_id)
+
     comment_form = CommentForm()
-    comments = Comment.objects.filter(post=post.pk).select_related('author')
+    comments = post.comments.select_related('author')
     context = {
         'post': post,
+        'archived': archived,
         'form': override_comment_form or comment_form,
         'comments': comments
     }
@@ -151,9 +210,25 @@ def add_comment(request, post_id):
         Добавление комментария к посту
     '''
 
-    post = get_object_or_404(Post, id=post_id)
+    # Сам пост не нужен - только проверка, что он существует
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
     comment = Comment(post=post, author=request.user)
     form = CommentForm(request.POST or None, instance=comment)
+
+    if request.is_ajax() and request.method == 'POST':
+        # Запрос со страницы поста через fetch: возвращаем только
+        # разметку нового комментария или ошибки формы, а не всю страницу
+        if form.is_valid():
+            form.save()
+            return render(request,
+                          'posts/includes/comment.html',
+                          {'comment': comment},
+                          status=HTTPStatus.CREATED)
+        return render(request,
+                      'includes/form_errors.html',
+                      {'form': form},
+                      status=HTTPStatus.BAD_REQUEST)
+
     if request.method == 'POST' and form.is_valid():
         form.save()
         return redirect('posts:post_detail', post.pk)
@@ -191,17 +266,19 @@ def follow_index(request):
     # ORDER BY "posts_post"."pub_date" DESC
     post = (Post.objects
             .filter(author__in=user.follower.values('author'))
-            .select_related('group', 'author')
-            .all())
+            .visible()
+            .for_feed())
 
-    paginator = Paginator(post, 10)
+    paginator = CachedCountPaginator(post, POSTS_PER_PAGE,
+                                     depends_on=(Follow,))
 
     page_number = request.GET.get('page', 1)
 
     page_obj = paginator.get_page(page_number)
 
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'recommendations': get_recommendations(user)
     }
 
     return render(request, 'posts/follow.html', context)
@@ -214,7 +291,7 @@ def profile_follow(request, username):
     '''
 
     user = request.user
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
     profile_redirect = redirect('posts:profile', author.username)
 
     # Не даем подписываться на самих себя
@@ -239,7 +316,7 @@ def profile_unfollow(request, username):
     '''
 
     user = request.user
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
 
     # Подписаться на себя мы не можем, значит и нечего дергать базу лишний раз
     # когда мы знаем что ответ будет пустой
@@ -247,3 +324,21 @@ def profile_unfollow(request, username):
         Follow.objects.filter(user=user, author=author).delete()
 
     return redirect('posts:profile', author.username)
+
+
+def sitemap_index(request):
+    '''
+        Индекс карт сайта: по ссылке на каждый шард каждого раздела
+    '''
+    return HttpResponse(render_index(), content_type='application/xml')
+
+
+def sitemap_shard(request, section, shard):
+    '''
+        Один шард карты сайта, из кеша или потоком
+    '''
+    if section not in SECTIONS or shard >= shard_count(section):
+        raise Http404
+
+    return StreamingHttpResponse(get_shard(section, shard),
+                                 content_type='application/xml')
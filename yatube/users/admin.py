@@ -0,0 +1,24 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
+
+from posts.deletion import delete_user
+
+User = get_user_model()
+
+
+class YatubeUserAdmin(UserAdmin):
+    actions = ('delete_in_background',)
+
+    def delete_in_background(self, request, queryset):
+        '''
+        Пользователь с тысячами постов удаляется обычным образом
+        минутами, поэтому только деактивируем, а остальное - в фоне
+        '''
+        for user in queryset.filter(is_active=True):
+            delete_user(user)
+    delete_in_background.short_description = 'Удалить в фоне'
+
+
+admin.site.unregister(User)
+admin.site.register(User, YatubeUserAdmin)
@@ -50,10 +50,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.admission.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CachedAuthenticationMiddleware',
+    'core.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -90,12 +92,120 @@ DATABASES = {
     }
 }
 
+# Общий для всех воркеров кеш: файл SQLite, отображаемый в память.
+# В продакшене LOCATION стоит перенести в /dev/shm
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SharedFileCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
     }
 }
 
+# manage.py test работает со своим кешем во временном каталоге
+# (core.testing.isolated_cache), pytest - см. conftest.py в корне
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Сессии читаются из кеша, а в базу только пишутся
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Сколько секунд пользователь из сессии живёт в кеше
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Кеш в памяти процесса для пользователей по username и групп по slug:
+# размер, время жизни найденных и отсутствующих записей (секунды)
+LOOKUP_CACHE_SIZE = 1024
+LOOKUP_CACHE_TTL = 60
+LOOKUP_CACHE_NEGATIVE_TTL = 10
+
+# Подписки пользователя для кнопок в карточках, сбрасываются
+# при подписке и отписке
+FOLLOWED_AUTHORS_CACHE_TIMEOUT = 60 * 60
+
+# Сколько секунд после истечения {% stale_cache %} можно отдавать
+# устаревший фрагмент, пока он перестраивается
+STALE_CACHE_TTL = 60
+
+# Как часто процесс сбрасывает в кеш счетчики попаданий {% stale_cache %}
+STALE_CACHE_STATS_INTERVAL = 10
+
+# COUNT(*) для паджинатора кешируется только для больших выборок
+PAGINATOR_CACHE_MIN_COUNT = 1000
+PAGINATOR_CACHE_TIMEOUT = 300
+
+# Ограничение частоты запросов по имени представления: 'N/период'
+# или ('N/период', методы), по умолчанию считаются только POST.
+# Анонимы различаются по адресу из RATE_LIMIT_IP_HEADER
+RATE_LIMITS = {
+    'posts:post_create': '10/m',
+    'posts:post_edit': '20/m',
+    'posts:add_comment': '20/m',
+    'posts:profile_follow': ('30/m', ('GET',)),
+    'users:signup': '5/m',
+}
+RATE_LIMIT_IP_HEADER = 'REMOTE_ADDR'
+
+# Сброс нагрузки: пороги одновременных запросов в процессе и ожидания
+# в очереди прокси (секунды, заголовок X-Request-Start). Выше мягкого
+# анонимам отдаются сохранённые страницы, выше жёсткого - 503 для
+# страниц паджинатора дальше ADMISSION_MAX_PAGE и путей из списка
+ADMISSION_SOFT_LIMIT = 8
+ADMISSION_HARD_LIMIT = 16
+ADMISSION_SOFT_QUEUE_WAIT = 0.5
+ADMISSION_HARD_QUEUE_WAIT = 2
+ADMISSION_QUEUE_HEADER = 'HTTP_X_REQUEST_START'
+ADMISSION_MAX_PAGE = 10
+ADMISSION_LOW_PRIORITY_PATHS = (
+    r'^/admin/\w+/\w+/$',
+)
+ADMISSION_RETRY_AFTER = 10
+
+# /health/ready/: таймаут каждой проверки, сколько секунд процесс
+# помнит результат и допустимое ожидание задачи в очереди
+HEALTH_PROBE_TIMEOUT = 2
+HEALTH_CACHE_SECONDS = 2
+HEALTH_MAX_TASK_LAG = 300
+
+# Фоновое удаление пользователей и групп (posts.deletion): записей
+# в одной транзакции и пачек за один запуск задачи
+DELETION_BATCH_SIZE = 500
+DELETION_BATCHES_PER_TASK = 20
+
+# Архив постов (manage.py archive_posts): посты старше N дней
+# переносятся с комментариями в отдельные таблицы пачками
+POST_ARCHIVE_AFTER_DAYS = 365
+POST_ARCHIVE_BATCH_SIZE = 500
+
+# Выгрузка страниц в HTML (manage.py export_static_site) для отдачи
+# файловым сервером или CDN. Число процессов по умолчанию - по ядрам
+STATIC_EXPORT_ROOT = os.path.join(BASE_DIR, 'export')
+STATIC_EXPORT_WORKERS = None
+
+# Карта сайта: адресов в шарде (не больше 50 000 по протоколу),
+# строк за один запрос и сколько хранить готовый XML шарда
+SITEMAP_SHARD_SIZE = 50000
+SITEMAP_CHUNK_SIZE = 2000
+SITEMAP_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Фоновые задачи core.tasks (manage.py run_worker)
+TASKS_WORKERS = 4
+TASKS_MAX_ATTEMPTS = 3
+TASKS_RETRY_DELAY = 10
+TASKS_VISIBILITY_TIMEOUT = 300
+
+# Вкладка "Популярное": период полураспада и окно в часах,
+# размер топа и веса событий
+TRENDING_HALF_LIFE = 6
+TRENDING_WINDOW = 48
+TRENDING_TOP_SIZE = 20
+TRENDING_POST_WEIGHT = 3
+TRENDING_COMMENT_WEIGHT = 1
+# Через сколько секунд топ собирается заново по счетчикам
+TRENDING_TOP_TIMEOUT = 10 * 60
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -135,6 +245,11 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 STATIC_URL = '/static/'
 
+# collectstatic собирает сюда файлы с хешем в имени и их .gz варианты,
+# а core.static.StaticFilesMiddleware их отдаёт
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
@@ -142,7 +257,20 @@ LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Адрес сайта для ссылок в письмах
+SITE_URL = 'http://127.0.0.1:8000'
+
+# Запас времени на одну пачку писем send_digests: если процесс
+# рассылки умер, через столько секунд её сможет начать другой
+DIGEST_LOCK_TIMEOUT = 10 * 60
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# 'stream' - отдаём файлы сами, 'x-accel-redirect' (nginx) или
+# 'x-sendfile' (apache, lighttpd) - отдаёт фронтовой прокси
+MEDIA_SERVE_MODE = 'stream'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24